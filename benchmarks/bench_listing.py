@@ -0,0 +1,34 @@
+# bench_listing.py
+# Microbenchmark: fast <pre> listing parser versus the BeautifulSoup fallback.
+# Run from the repository root: python benchmarks/bench_listing.py [entries]
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_ops import parse_listing_pre, parse_listing_soup
+
+# Build a DATALOG day folder page in the format the card serves
+def make_listing(entries):
+    lines = ['<a href="photo">back to photo</a>',
+             '2024- 1- 2   22: 0: 0         &lt;DIR&gt;   <a href="dir?dir=A:%5CDATALOG%5C20240102">.</a>',
+             '2024- 1- 2   22: 0: 0         &lt;DIR&gt;   <a href="dir?dir=A:%5CDATALOG">..</a>']
+    for i in range(entries):
+        name = f'20240102_{i:06d}_BRP.edf'
+        lines.append(f'2024- 1- 2   {i % 24:2d}:{i % 60:2d}:{i % 60:2d}       {i % 900 + 1}KB  '
+                     f'<a href="download?file=DATALOG%5C20240102%5C{name}">{name}</a>')
+    return '<html><body><h1>A:\\DATALOG\\20240102</h1><pre>\n' + '\n'.join(lines) + '\n</pre></body></html>'
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    html = make_listing(entries)
+    assert parse_listing_pre(html) == parse_listing_soup(html), 'parsers disagree'
+
+    for name, func in (('pre', parse_listing_pre), ('soup', parse_listing_soup)):
+        runs, total = timeit.Timer(lambda: func(html)).autorange()
+        per_call = total / runs
+        print(f'{name:>5}: {per_call * 1000:8.3f} ms/page  {entries / per_call:12,.0f} entries/s')
+
+if __name__ == '__main__':
+    main()
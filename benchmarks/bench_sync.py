@@ -0,0 +1,86 @@
+# bench_sync.py
+# Benchmark: listing rate, transfer throughput and end-to-end sync time against the local mock card.
+# Wi-Fi goes through the null backend, so joining, the readiness probe and leaving run as in the app without a radio.
+# Run from the repository root: python benchmarks/bench_sync.py --nights 90 --latency 0.02 --bandwidth 2000000
+import argparse
+import os
+import pathlib
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ezshare import ezShare
+from file_ops import list_dir, recursive_traversal
+from mock_card import MockCard
+from wifi import NullBackend
+
+def make_ezshare(args, url, path):
+    ezshare = ezShare()
+    ezshare.set_params(path=path, url=url, start_time=None, show_progress=False, verbose=False,
+                       overwrite=False, keep_old=False, ssid='ez Share', psk='88888888', ignore=[], retries=3,
+                       connection_delay=0, debug=False, incremental=not args.full,
+                       max_workers=args.workers, engine=args.engine, durability=args.durability,
+                       wifi_backend=NullBackend())
+    return ezshare
+
+def bench_listing(args, url, path):
+    ezshare = make_ezshare(args, url, path)
+    datalog_url = url + '%5CDATALOG'
+    started = time.perf_counter()
+    for _ in range(args.listings):
+        files, dirs = list_dir(ezshare, datalog_url)
+    elapsed = time.perf_counter() - started
+    print(f'list_dir:            {args.listings / elapsed:8.1f} listings/s  ({len(dirs)} night folders per listing)')
+
+def bench_traversal(args, card, url, path):
+    ezshare = make_ezshare(args, url, path)
+    before = card.counters['bytes']
+    started = time.perf_counter()
+    processed = recursive_traversal(ezshare, url, pathlib.Path(path), 0, 0)
+    elapsed = time.perf_counter() - started
+    megabytes = (card.counters['bytes'] - before) / 1024 ** 2
+    print(f'recursive_traversal: {megabytes / elapsed:8.2f} MB/s  {processed} files  {elapsed:.2f}s wall')
+
+def bench_run(args, card, url, path, label):
+    ezshare = make_ezshare(args, url, path)
+    before = dict(card.counters)
+    started = time.perf_counter()
+    ezshare.run()
+    elapsed = time.perf_counter() - started
+    listings = card.counters['dir'] - before['dir']
+    megabytes = (card.counters['bytes'] - before['bytes']) / 1024 ** 2
+    print(f'ezShare.run ({label}): {elapsed:8.2f}s wall  {ezshare.processed_files}/{ezshare.total_files} files  '
+          f'{listings} listings  {megabytes:.1f} MB')
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark sync performance against a mock ez Share card')
+    parser.add_argument('--nights', type=int, default=30)
+    parser.add_argument('--night-hours', type=float, default=1.0)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--bandwidth', type=int, default=0, help='bytes per second per response, 0 for unlimited')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--listings', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=3)
+    parser.add_argument('--engine', choices=['serial', 'pipelined'], default='serial')
+    parser.add_argument('--durability', choices=['strict', 'batched'], default='batched')
+    parser.add_argument('--full', action='store_true', help='disable incremental sync for the repeat run')
+    args = parser.parse_args()
+
+    card = MockCard(args.nights, args.night_hours, latency=args.latency, bandwidth=args.bandwidth,
+                    error_rate=args.error_rate)
+    url = card.start()
+    try:
+        with tempfile.TemporaryDirectory() as traversal_dir, tempfile.TemporaryDirectory() as run_dir:
+            bench_listing(args, url, traversal_dir)
+            bench_traversal(args, card, url, traversal_dir)
+            bench_run(args, card, url, run_dir, 'first')
+            bench_run(args, card, url, run_dir, 'repeat')
+    finally:
+        card.stop()
+    print(f'mock card counters: {card.counters}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# bench_write.py
+# Benchmark: download write path, 1 KiB iter_content loop versus file_ops.download_file().
+# The payload is a well-formed EDF, so the current path also pays for its streaming validation.
+# Run from the repository root: python benchmarks/bench_write.py [megabytes] [files]
+import datetime
+import functools
+import http.server
+import os
+import pathlib
+import sys
+import tempfile
+import threading
+import time
+from tempfile import NamedTemporaryFile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ezshare import ezShare
+from file_ops import download_file
+from mock_card import make_edf
+
+# One 512-sample signal: 1 KiB per data record
+BENCH_SIGNALS = [('Flow.40ms', 512)]
+
+# Serve one fixed payload over keep-alive HTTP/1.1
+def start_server(payload):
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}/download?file=BRP.edf'
+
+# The write path as it was: 1 KiB chunks through a buffered NamedTemporaryFile
+def legacy_download(ezshare, url, file_path, file_ts=None):
+    response = ezshare.session.get(url, stream=True)
+    with NamedTemporaryFile(delete=False, dir=file_path.parent) as tmp_file:
+        for data in response.iter_content(1024):
+            tmp_file.write(data)
+        tmp_file.flush()
+        os.fsync(tmp_file.fileno())
+        pathlib.Path(tmp_file.name).replace(file_path)
+    return True
+
+def measure(name, func, ezshare, url, target, files, size):
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    for _ in range(files):
+        func(ezshare, url, target)
+    wall, cpu = time.perf_counter() - wall_start, time.process_time() - cpu_start
+    megabytes = size * files / 1024 ** 2
+    print(f'{name:>8}: {megabytes / wall:8.1f} MB/s  {cpu / megabytes * 1000:7.2f} ms CPU/MB')
+
+def main():
+    megabytes = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    files = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    payload = make_edf(datetime.datetime(2024, 1, 1, 22), megabytes * 1024, BENCH_SIGNALS)
+    server, url = start_server(payload)
+    ezshare = ezShare()
+    # Listings show sizes in whole KB
+    current_download = functools.partial(download_file, listed_size=len(payload) // 1024 * 1024, size_unit=1024)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        target = pathlib.Path(tmp_dir) / 'BRP.edf'
+        measure('legacy', legacy_download, ezshare, url, target, files, len(payload))
+        measure('current', current_download, ezshare, url, target, files, len(payload))
+        assert target.read_bytes() == payload, 'downloaded file does not match the payload'
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
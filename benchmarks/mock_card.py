@@ -0,0 +1,232 @@
+# mock_card.py
+# Local stand-in for an ez Share card: serves the card's dir?dir=A: <pre> listings and download?file= endpoints
+# for a synthetic ResMed tree (STR.edf, Identification files, SETTINGS, DATALOG/YYYYMMDD nights of EDF files).
+# Run on its own to point the app at it: python benchmarks/mock_card.py --port 8080
+import argparse
+import datetime
+import functools
+import http.server
+import random
+import threading
+import time
+import urllib.parse
+
+# Signals per night file: (suffix, [(label, samples per 1 s record)])
+NIGHT_FILES = [
+    ('BRP', [('Flow.40ms', 25), ('Press.40ms', 25)]),
+    ('PLD', [('MaskPress.2s', 1), ('Leak.2s', 1), ('RespRate.2s', 1), ('TidVol.2s', 1), ('MinVent.2s', 1)]),
+    ('SAD', [('Pulse.1s', 1), ('SpO2.1s', 1)]),
+    ('EVE', [('EDF Annotations', 30)]),
+    ('CSL', [('EDF Annotations', 30)]),
+]
+
+# Build a minimal but well-formed EDF file: fixed header, one signal header per signal, then data records
+def make_edf(start, records, signals, record_seconds=1):
+    ns = len(signals)
+    header_bytes = 256 * (ns + 1)
+
+    def field(value, width):
+        return str(value).ljust(width)[:width]
+
+    header = (field('0', 8) + field('X X X X', 80) + field('Startdate X X X X', 80)
+              + start.strftime('%d.%m.%y') + start.strftime('%H.%M.%S')
+              + field(header_bytes, 8) + field('EDF+C', 44) + field(records, 8)
+              + field(record_seconds, 8) + field(ns, 4))
+    columns = [
+        [field(label, 16) for label, _ in signals],
+        [field('', 80)] * ns,
+        [field('', 8)] * ns,
+        [field('-32768', 8)] * ns,
+        [field('32767', 8)] * ns,
+        [field('-32768', 8)] * ns,
+        [field('32767', 8)] * ns,
+        [field('', 80)] * ns,
+        [field(samples, 8) for _, samples in signals],
+        [field('', 32)] * ns,
+    ]
+    header += ''.join(''.join(column) for column in columns)
+    record_size = 2 * sum(samples for _, samples in signals)
+    pattern = bytes(range(256)) * (record_size // 256 + 1)
+    return header.encode('ascii') + pattern[:record_size] * records
+
+class MockCard:
+    def __init__(self, nights=30, night_hours=1.0, first_night=datetime.date(2024, 1, 1),
+                 latency=0.0, bandwidth=0, error_rate=0.0, seed=0):
+        self.latency = latency            # seconds added before every response
+        self.bandwidth = bandwidth        # bytes per second per response, 0 for unlimited
+        self.error_rate = error_rate      # chance of a 500 or a connection dropped mid-body
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counters = {'dir': 0, 'download': 0, 'errors': 0, 'bytes': 0}
+        self.tree = self.build_tree(nights, night_hours, first_night)
+        self.server = None
+
+    # Directory tree as nested dicts; files map to (modified datetime, size, content factory)
+    def build_tree(self, nights, night_hours, first_night):
+        datalog = {}
+        last_start = None
+        for night in range(nights):
+            day = first_night + datetime.timedelta(days=night)
+            start = datetime.datetime.combine(day, datetime.time(22, 30))
+            last_start = start
+            records = int(night_hours * 3600)
+            folder = {}
+            for suffix, signals in NIGHT_FILES:
+                name = f'{start:%Y%m%d_%H%M%S}_{suffix}.edf'
+                factory = functools.partial(make_edf, start, records, signals)
+                size = 256 * (len(signals) + 1) + 2 * sum(samples for _, samples in signals) * records
+                folder[name] = (start + datetime.timedelta(hours=night_hours), size, factory)
+            datalog[day.strftime('%Y%m%d')] = folder
+        modified = last_start or datetime.datetime(2024, 1, 1)
+        str_factory = functools.partial(make_edf, datetime.datetime.combine(first_night, datetime.time()),
+                                        max(nights, 1), [('MaskOn', 10), ('MaskOff', 10), ('Leak.50', 1)], 86400)
+        return {
+            'STR.EDF': (modified, len(str_factory()), str_factory),
+            'Identification.crc': (modified, 4, lambda: b'\x01\x02\x03\x04'),
+            'Identification.tgt': (modified, 64, lambda: b'#SRN 23000000000\n#PNA AirSense_10\n'.ljust(64, b' ')),
+            'DATALOG': datalog,
+            'SETTINGS': {'CurrentSettings.json': (modified, 32, lambda: b'{"settings": "mock"}'.ljust(32))},
+        }
+
+    def lookup(self, card_path):
+        node = self.tree
+        for part in [part for part in card_path.split('\\')[1:] if part]:
+            node = node[part]
+        return node
+
+    # Render a listing the way the card does: date, time, size or <DIR>, then the link
+    def listing(self, card_path):
+        def line(modified, size_column, href, name):
+            stamp = f'{modified.year}-{modified.month:2d}-{modified.day:2d}   {modified.hour:2d}:{modified.minute:2d}:{modified.second:2d}'
+            return f'{stamp}   {size_column:>12}  <a href="{href}">{name}</a>'
+
+        parent = card_path.rsplit('\\', 1)[0] if '\\' in card_path else card_path
+        epoch = datetime.datetime(2024, 1, 1)
+        # The card's pages start with a link back to its photo view, which has no date or size
+        lines = ['<a href="photo">back to photo</a>',
+                 line(epoch, '&lt;DIR&gt;', f'dir?dir={urllib.parse.quote(card_path)}', '.'),
+                 line(epoch, '&lt;DIR&gt;', f'dir?dir={urllib.parse.quote(parent)}', '..')]
+        for name, node in self.lookup(card_path).items():
+            child = f'{card_path}\\{name}'
+            if isinstance(node, dict):
+                lines.append(line(epoch, '&lt;DIR&gt;', f'dir?dir={urllib.parse.quote(child)}', name))
+            else:
+                modified, size, _ = node
+                file_param = urllib.parse.quote(child.split('\\', 1)[1])
+                lines.append(line(modified, f'{max(1, size // 1024)}KB', f'download?file={file_param}', name))
+        return (f'<html><head><title>ez Share</title></head><body><h1>{card_path}</h1><pre>\n'
+                + '\n'.join(lines) + '\n</pre></body></html>').encode('utf-8')
+
+    def should_fail(self):
+        with self.lock:
+            failed = self.error_rate and self.random.random() < self.error_rate
+            if failed:
+                self.counters['errors'] += 1
+            return failed
+
+    def count(self, key, amount=1):
+        with self.lock:
+            self.counters[key] += amount
+
+    def start(self, host='127.0.0.1', port=0):
+        card = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if card.latency:
+                    time.sleep(card.latency)
+                parsed = urllib.parse.urlparse(self.path)
+                query = urllib.parse.parse_qs(parsed.query)
+                try:
+                    if parsed.path == '/dir':
+                        card.count('dir')
+                        body = card.listing(query['dir'][0])
+                        return self.respond(200, body, 'text/html')
+                    if parsed.path == '/download':
+                        card.count('download')
+                        _, _, factory = card.lookup('A:\\' + query['file'][0])
+                        return self.download(factory())
+                except (KeyError, TypeError, ValueError):
+                    pass
+                self.respond(404, b'Not found', 'text/plain')
+
+            def download(self, content):
+                fail = card.should_fail()
+                if fail and card.random.random() < 0.5:
+                    return self.respond(500, b'Internal error', 'text/plain')
+                start = 0
+                requested = self.headers.get('Range', '')
+                if requested.startswith('bytes=') and requested.endswith('-'):
+                    start = int(requested[6:-1])
+                    if start >= len(content):
+                        return self.respond(416, b'', 'text/plain')
+                body = content[start:]
+                self.send_response(206 if start else 200)
+                if start:
+                    self.send_header('Content-Range', f'bytes {start}-{len(content) - 1}/{len(content)}')
+                self.send_header('Content-Type', 'application/octet-stream')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                # A failure that was not a 500 drops the connection half-way through the body
+                self.send_body(body[:len(body) // 2] if fail else body)
+                if fail:
+                    self.close_connection = True
+
+            def respond(self, status, body, content_type):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.send_body(body)
+
+            def send_body(self, body):
+                chunk = 16 * 1024
+                sent = 0
+                try:
+                    for offset in range(0, len(body), chunk):
+                        self.wfile.write(body[offset:offset + chunk])
+                        sent += len(body[offset:offset + chunk])
+                        if card.bandwidth:
+                            time.sleep(min(chunk, len(body) - offset) / card.bandwidth)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client hung up mid-body, e.g. a cancelled sync
+                    self.close_connection = True
+                card.count('bytes', sent)
+
+        self.server = http.server.ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return f'http://{host}:{self.server.server_address[1]}/dir?dir=A:'
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a synthetic ez Share card')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--nights', type=int, default=30)
+    parser.add_argument('--night-hours', type=float, default=1.0)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds per response')
+    parser.add_argument('--bandwidth', type=int, default=0, help='bytes per second per response, 0 for unlimited')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    args = parser.parse_args()
+    card = MockCard(args.nights, args.night_hours, latency=args.latency, bandwidth=args.bandwidth,
+                    error_rate=args.error_rate)
+    url = card.start(port=args.port)
+    print(f'Mock ez Share card at {url} (Ctrl+C to stop)')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        card.stop()
+
+if __name__ == '__main__':
+    main()
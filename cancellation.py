@@ -0,0 +1,36 @@
+# cancellation.py
+# Cooperative cancellation: the GUI or CLI sets the token and the sync checks it between steps and between chunks,
+# so it stops at a point where files, the sync index and the Wi-Fi connection can be left consistent.
+import threading
+import time
+
+# Raised by CancelToken.check() once cancellation has been requested
+class Cancelled(Exception):
+    pass
+
+class CancelToken:
+    def __init__(self):
+        self.event = threading.Event()
+        self.requested_at = None
+
+    def cancel(self):
+        if not self.event.is_set():
+            self.requested_at = time.perf_counter()
+            self.event.set()
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def check(self):
+        if self.event.is_set():
+            raise Cancelled()
+
+    # Sleep that ends early on cancellation; raises Cancelled if it did
+    def sleep(self, seconds):
+        if self.event.wait(seconds):
+            raise Cancelled()
+
+    # Seconds since cancel() was called
+    def elapsed(self):
+        return time.perf_counter() - self.requested_at if self.requested_at is not None else None
@@ -0,0 +1,190 @@
+# cli.py
+# Headless sync for launchd/cron: drives ezShare directly from config.ini and/or flags, without importing Qt.
+import argparse
+import configparser
+import json
+import os
+import signal
+import sys
+import time
+from ezshare import ezShare
+from cancellation import CancelToken
+
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.ini')
+
+# Same defaults the GUI writes to a fresh config.ini
+DEFAULT_SETTINGS = {
+    'path': '~/Documents/CPAP_Data/SD_card',
+    'url': 'http://192.168.4.1/dir?dir=A:',
+    'incremental': 'True',
+    'max_workers': '3',
+    'engine': 'serial',
+    'chunk_size': '262144',
+    'durability': 'batched',
+    'performance_report': 'False',
+}
+DEFAULT_WIFI = {
+    'ssid': 'ez Share',
+    'psk': '88888888',
+}
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Sync an ez Share card without the GUI')
+    parser.add_argument('--config', default=DEFAULT_CONFIG, help='config.ini to read settings from')
+    parser.add_argument('--path', help='local directory to sync into')
+    parser.add_argument('--url', help='card URL, e.g. http://192.168.4.1/dir?dir=A:')
+    parser.add_argument('--ssid', help='Wi-Fi network of the card')
+    parser.add_argument('--psk', help='Wi-Fi password of the card')
+    parser.add_argument('--no-wifi', action='store_true', help='the card is already reachable, do not join its network')
+    parser.add_argument('--full', action='store_true', help='list every night instead of syncing incrementally')
+    parser.add_argument('--overwrite', action='store_true', help='download every file even if up to date')
+    parser.add_argument('--workers', type=int, help='parallel downloads')
+    parser.add_argument('--engine', choices=['serial', 'pipelined'])
+    parser.add_argument('--durability', choices=['strict', 'batched'])
+    parser.add_argument('--retries', type=int, default=3)
+    parser.add_argument('--connection-delay', type=float, default=5, help='fixed wait after joining, used with --ready-timeout 0')
+    parser.add_argument('--ready-timeout', type=float, default=30, help='seconds to wait for the card to answer after joining')
+    parser.add_argument('--all-cards', action='store_true', help='sync every [Card:<name>] profile in the config')
+    parser.add_argument('--card', action='append', help='sync only this card profile (repeatable)')
+    parser.add_argument('--report', action='store_true', help='write a performance report after the run')
+    parser.add_argument('--json', action='store_true', help='print progress as JSON lines instead of text')
+    parser.add_argument('--verbose', '-v', action='store_true')
+    parser.add_argument('--debug', action='store_true')
+    return parser.parse_args(argv)
+
+def load_config(path):
+    config = configparser.ConfigParser()
+    config.read_dict({'Settings': DEFAULT_SETTINGS, 'WiFi': DEFAULT_WIFI})
+    config.read(path)
+    return config
+
+# Text output prints every status and each whole-percent progress step; JSON output emits one object per event
+class ProgressPrinter:
+    def __init__(self, as_json):
+        self.as_json = as_json
+        self.last_percent = None
+
+    def emit(self, event, **fields):
+        if self.as_json:
+            print(json.dumps({'event': event, 'time': round(time.time(), 3), **fields}), flush=True)
+
+    def status(self, message):
+        if self.as_json:
+            self.emit('status', message=message)
+        else:
+            print(message, flush=True)
+
+    def progress(self, value):
+        percent = int(value)
+        if percent == self.last_percent:
+            return
+        self.last_percent = percent
+        if self.as_json:
+            self.emit('progress', percent=percent)
+        else:
+            print(f'{percent}%', flush=True)
+
+# set_params keyword arguments shared by every card; path, url, ssid and psk are per card
+def sync_params(args, settings):
+    return dict(
+        start_time=None,
+        show_progress=False,
+        verbose=args.verbose,
+        overwrite=args.overwrite,
+        keep_old=False,
+        ignore=[],
+        retries=args.retries,
+        connection_delay=args.connection_delay,
+        ready_timeout=args.ready_timeout,
+        debug=args.debug,
+        incremental=settings.getboolean('incremental', True) and not args.full,
+        max_workers=args.workers or settings.getint('max_workers', 3),
+        engine=args.engine or settings.get('engine', 'serial'),
+        chunk_size=settings.getint('chunk_size', 262144),
+        durability=args.durability or settings.get('durability', 'batched'),
+        performance_report=args.report or settings.getboolean('performance_report', False)
+    )
+
+# First Ctrl-C cancels cleanly (completed files kept, Wi-Fi restored); a second one aborts at once
+def interrupt(cancel_token, signum, frame):
+    if cancel_token.cancelled:
+        signal.default_int_handler(signum, frame)
+    cancel_token.cancel()
+
+def summary_ok(summary):
+    return summary['completed'] and summary['processed'] >= summary['total'] and not summary['listing_errors']
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = load_config(args.config)
+    settings = config['Settings']
+    printer = ProgressPrinter(args.json)
+    if args.all_cards or args.card:
+        return sync_all_cards(args, config, printer)
+    ssid = None if args.no_wifi else (args.ssid or config['WiFi'].get('ssid'))
+
+    ezshare = ezShare()
+    ezshare.set_params(
+        path=args.path or settings.get('path'),
+        url=args.url or settings.get('url'),
+        ssid=ssid,
+        psk=args.psk or config['WiFi'].get('psk'),
+        **sync_params(args, settings)
+    )
+    ezshare.set_status_callback(printer.status)
+    ezshare.set_progress_callback(printer.progress)
+    signal.signal(signal.SIGINT, lambda signum, frame: interrupt(ezshare.cancel_token, signum, frame))
+
+    started = time.perf_counter()
+    completed = ezshare.run()
+    summary = {'completed': bool(completed), 'processed': ezshare.processed_files, 'total': ezshare.total_files,
+               'listing_errors': ezshare.listing_errors, 'seconds': round(time.perf_counter() - started, 3)}
+    ok = summary_ok(summary)
+    if args.json:
+        printer.emit('finished', **summary)
+    else:
+        print(f"Synced {summary['processed']}/{summary['total']} files in {summary['seconds']:.1f}s"
+              + ('' if ok else ' (incomplete)'))
+    return 0 if ok else 1
+
+# Sync the [Card:<name>] profiles; progress is the mean over all cards
+def sync_all_cards(args, config, printer):
+    from multi_sync import load_card_profiles, sync_cards
+    profiles = load_card_profiles(config)
+    if args.card:
+        profiles = [profile for profile in profiles if profile['name'] in args.card]
+    if args.no_wifi:
+        for profile in profiles:
+            profile['ssid'] = None
+    if not profiles:
+        printer.status('No matching [Card:<name>] sections in the config.')
+        return 1
+
+    def on_event(card, kind, value, overall):
+        if kind == 'status':
+            if args.json:
+                printer.emit('status', card=card, message=value)
+            else:
+                print(f'[{card}] {value}', flush=True)
+        else:
+            printer.progress(overall)
+
+    # Ctrl-C reaches the worker processes too; they ignore it and stop when the parent cancels them
+    cancel_token = CancelToken()
+    signal.signal(signal.SIGINT, lambda signum, frame: interrupt(cancel_token, signum, frame))
+
+    started = time.perf_counter()
+    summaries = sync_cards(profiles, sync_params(args, config['Settings']), on_event, cancel_token=cancel_token)
+    ok = all(summary_ok(summary) for summary in summaries)
+    for summary in summaries:
+        if args.json:
+            printer.emit('finished', **summary)
+        else:
+            print(f"[{summary['card']}] Synced {summary['processed']}/{summary['total']} files in "
+                  f"{summary['seconds']:.1f}s" + ('' if summary_ok(summary) else ' (incomplete)'))
+    if not args.json:
+        print(f'All cards finished in {time.perf_counter() - started:.1f}s')
+    return 0 if ok else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
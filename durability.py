@@ -0,0 +1,102 @@
+# durability.py
+import functools
+import os
+import sys
+import threading
+import logging
+import pathlib
+
+logger = logging.getLogger(__name__)
+
+# 'strict' fsyncs and publishes every file on its own; 'batched' stages a directory and publishes it as a group
+DURABILITY_MODES = ('strict', 'batched')
+
+# Completed downloads waiting in temp files until their directory is made durable in one go
+class StagedBatch:
+    def __init__(self, directory):
+        self.directory = pathlib.Path(directory)
+        self.lock = threading.Lock()
+        self.staged = []
+
+    # Stage a fully written temp file; its timestamp is set now so it survives the rename
+    def add(self, tmp_path, final_path, file_ts=None):
+        if file_ts:
+            os.utime(tmp_path, (file_ts, file_ts))
+        with self.lock:
+            self.staged.append((pathlib.Path(tmp_path), pathlib.Path(final_path)))
+
+    # Flush all staged data, rename every temp file into place, then persist the directory entries.
+    # Final names never appear before their data is on disk, so a crash leaves only temp files behind.
+    def commit(self):
+        with self.lock:
+            staged, self.staged = self.staged, []
+        if not staged:
+            return []
+        sync_data([tmp_path for tmp_path, _ in staged], self.directory)
+        published = []
+        for tmp_path, final_path in staged:
+            try:
+                tmp_path.replace(final_path)
+                published.append(final_path)
+            except OSError as e:
+                logger.error('Error publishing %s: %s', final_path, e)
+                tmp_path.unlink(missing_ok=True)
+        sync_directory(self.directory)
+        logger.info('%d files in %s made durable', len(published), self.directory)
+        return published
+
+# Make the contents of several files durable with as few flushes as the platform allows
+def sync_data(paths, directory):
+    if sys.platform.startswith('linux') and sync_filesystem(directory):
+        return
+    for path in paths:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    if sys.platform == 'darwin':
+        # fsync() on macOS stops at the drive cache; one F_FULLFSYNC flushes it for the whole batch
+        import fcntl
+        fd = os.open(directory, os.O_RDONLY)
+        try:
+            fcntl.fcntl(fd, fcntl.F_FULLFSYNC)
+        except OSError as e:
+            logger.debug('F_FULLFSYNC not supported for %s: %s', directory, e)
+        finally:
+            os.close(fd)
+
+# Linux syncfs() on the directory: one call flushes the batch, and only the filesystem it is on.
+# Returns False where syncfs is unavailable or fails, leaving the caller to fsync each file.
+def sync_filesystem(directory):
+    import ctypes
+    syncfs = load_syncfs()
+    if syncfs is None:
+        return False
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        if syncfs(fd) == 0:
+            return True
+        logger.debug('syncfs failed for %s: %s', directory, os.strerror(ctypes.get_errno()))
+        return False
+    finally:
+        os.close(fd)
+
+@functools.lru_cache(maxsize=None)
+def load_syncfs():
+    import ctypes
+    try:
+        return ctypes.CDLL(None, use_errno=True).syncfs
+    except (OSError, AttributeError) as e:
+        logger.debug('syncfs not available: %s', e)
+        return None
+
+# Persist renames in a directory; not possible (or needed) on Windows
+def sync_directory(directory):
+    if os.name != 'posix':
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
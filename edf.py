@@ -0,0 +1,133 @@
+# edf.py
+# Reads just the headers of EDF files: when a recording starts, how long it runs and which signals it holds.
+import collections
+import datetime
+
+# Fixed part of every EDF header; each signal then adds another 256 bytes spread over the signal fields
+FIXED_HEADER_SIZE = 256
+SIGNAL_HEADER_SIZE = 256
+
+# Widths of the per-signal fields, in the order they follow the fixed header
+SIGNAL_FIELDS = (('label', 16), ('transducer', 80), ('dimension', 8), ('physical_min', 8), ('physical_max', 8),
+                 ('digital_min', 8), ('digital_max', 8), ('prefilter', 80), ('samples', 8), ('reserved', 32))
+
+# Parsed header; duration is None while a recorder has not written the record count yet (-1).
+# signals is a tuple of (label, samples per second); record_size is the bytes in one data record.
+EdfHeader = collections.namedtuple('EdfHeader', ['start', 'duration', 'records', 'record_seconds',
+                                                 'signals', 'header_bytes', 'record_size'])
+
+def text(data, start, width):
+    return data[start:start + width].decode('ascii', 'replace').strip()
+
+def number(data, start, width, convert=int):
+    value = text(data, start, width)
+    try:
+        return convert(value)
+    except ValueError:
+        raise ValueError(f'bad EDF header field {value!r} at byte {start}') from None
+
+# Total header length declared by the fixed part, so a reader knows how much more to read
+def header_length(fixed):
+    if len(fixed) < FIXED_HEADER_SIZE:
+        raise ValueError(f'EDF header needs {FIXED_HEADER_SIZE} bytes, got {len(fixed)}')
+    signal_count = number(fixed, 252, 4)
+    if signal_count < 1:
+        raise ValueError(f'EDF header declares {signal_count} signals')
+    return FIXED_HEADER_SIZE + signal_count * SIGNAL_HEADER_SIZE
+
+# Parse a complete header (fixed part plus signal headers); raises ValueError if it is not a valid EDF header
+def parse_header(data):
+    header_bytes = header_length(data)
+    if len(data) < header_bytes:
+        raise ValueError(f'EDF header needs {header_bytes} bytes, got {len(data)}')
+    if number(data, 184, 8) != header_bytes:
+        raise ValueError('EDF header size does not match its signal count')
+    start = parse_start(text(data, 168, 8), text(data, 176, 8))
+    records = number(data, 236, 8)
+    record_seconds = number(data, 244, 8, float)
+
+    signal_count = (header_bytes - FIXED_HEADER_SIZE) // SIGNAL_HEADER_SIZE
+    fields = {}
+    offset = FIXED_HEADER_SIZE
+    for name, width in SIGNAL_FIELDS:
+        fields[name] = [data[offset + i * width:offset + (i + 1) * width] for i in range(signal_count)]
+        offset += width * signal_count
+    samples = [number(value, 0, len(value)) for value in fields['samples']]
+    labels = [value.decode('ascii', 'replace').strip() for value in fields['label']]
+    # Annotation-only files such as EVE and CSL have no real sample rate; 0-second records mean none either
+    signals = tuple((label, count / record_seconds if record_seconds > 0 else 0.0)
+                    for label, count in zip(labels, samples))
+    duration = records * record_seconds if records >= 0 else None
+    return EdfHeader(start, duration, records, record_seconds, signals, header_bytes, 2 * sum(samples))
+
+# EDF stores dd.mm.yy and hh.mm.ss; two-digit years 85-99 are 1985-1999, the rest 2000-2084
+def parse_start(date_text, time_text):
+    try:
+        day, month, year = (int(part) for part in date_text.split('.'))
+        hour, minute, second = (int(part) for part in time_text.split('.'))
+        year += 1900 if year >= 85 else 2000
+        return datetime.datetime(year, month, day, hour, minute, second)
+    except ValueError:
+        raise ValueError(f'bad EDF start {date_text!r} {time_text!r}') from None
+
+# Read only the header of an EDF file on disk
+def read_header(path):
+    with open(path, 'rb') as edf_file:
+        fixed = edf_file.read(FIXED_HEADER_SIZE)
+        return parse_header(fixed + edf_file.read(header_length(fixed) - FIXED_HEADER_SIZE))
+
+# Checks an EDF file while it streams in: the header must parse as soon as it is complete,
+# and the file must end exactly after the data records the header declares.
+# Strict validators raise ValueError on the first problem; lenient ones keep it in error and stop checking.
+class EdfStreamValidator:
+    def __init__(self, strict=True):
+        self.strict = strict
+        self.error = None
+        self.header = None
+        self.buffer = bytearray()
+        self.needed = FIXED_HEADER_SIZE
+
+    # Feed the file's bytes in order; a bad header is reported as soon as it is known
+    def feed(self, data):
+        if self.error is None:
+            self.check(self.read_header, data)
+
+    # Called with the final size once the transfer is complete
+    def finish(self, size):
+        if self.error is None:
+            self.check(self.check_size, size)
+
+    def check(self, step, *args):
+        try:
+            step(*args)
+        except ValueError as e:
+            if self.strict:
+                raise
+            self.error = str(e)
+
+    def read_header(self, data):
+        offset = 0
+        while self.header is None:
+            take = self.needed - len(self.buffer)
+            self.buffer += data[offset:offset + take]
+            offset += take
+            if len(self.buffer) < self.needed:
+                return
+            if self.needed == FIXED_HEADER_SIZE:
+                self.needed = header_length(self.buffer)
+            else:
+                self.header = parse_header(bytes(self.buffer))
+                self.buffer = None
+
+    # File size the header declares, or None while the record count is still unknown (-1)
+    def expected_size(self):
+        if self.header is None or self.header.records < 0:
+            return None
+        return self.header.header_bytes + self.header.records * self.header.record_size
+
+    def check_size(self, size):
+        if self.header is None:
+            raise ValueError(f'file ends after {size} bytes, inside its EDF header')
+        expected = self.expected_size()
+        if expected is not None and size != expected:
+            raise ValueError(f'EDF header declares {self.header.records} records ({expected} bytes), got {size} bytes')
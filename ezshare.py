@@ -1,14 +1,22 @@
 # ezshare.py
 import pathlib
 import logging
+import platform
 import sys
-import requests
-import time
-import urllib.parse
-from urllib3.util import retry
-from requests import adapters
+import sqlite3
 from wifi import connect_to_wifi, disconnect_from_wifi, wifi_connected
-from file_ops import recursive_traversal, list_dir
+from file_ops import recursive_traversal, build_manifest, pending_files, latest_night, is_night_folder, DEFAULT_CHUNK_SIZE
+from pipeline import pipelined_traversal
+from http_pool import create_session, connection_stats, wait_for_card, DEFAULT_TIMEOUT, READY_TIMEOUT
+from sync_index import SyncIndex
+from durability import DURABILITY_MODES
+from tracing import Tracer, JsonReportSink, LoggingSink
+from progress import ByteProgress, file_weight
+from cancellation import CancelToken, Cancelled
+from edf import read_header
+
+# Per-run performance report, written to the target path when enabled
+REPORT_FILENAME = '.ezshare_report.json'
 
 # Main class to manage EzShare operations
 class ezShare:
@@ -24,22 +32,47 @@ class ezShare:
         self.psk = None
         self.connection_id = None
         self.interface_name = None
-        self.platform_system = 'Darwin'  # Hardcoded for macOS
+        self.platform_system = platform.system()
+        self.wifi_backend = None  # None picks the backend for platform_system
+        self.previous_network = None  # Network to return to once the sync is done
+        self.home_network = None  # How and how fast the last disconnect got back to it
         self.connected = False
-        self.session = requests.Session()
+        self.session = create_session()
         self.ignore = None
         self.retries = None
-        self.retry = None
+        self.timeout = DEFAULT_TIMEOUT
+        self.keep_alive = True
+        self.chunk_size = DEFAULT_CHUNK_SIZE
+        self.durability = 'batched'
+        self.tracer = Tracer()
         self.connection_delay = None
+        self.ready_timeout = READY_TIMEOUT
+        self.ready_latency = None
         self.debug = None
         self.progress_callback = None
         self.status_callback = None
         self.total_files = 0
         self.processed_files = 0
+        self.byte_progress = ByteProgress(self.update_progress)  # Progress weighted by listing sizes
+        self.cancel_token = CancelToken()
+        self.cancel_latency = None
+        self.manifest = []
+        self.sync_index = None
+        self.incremental = True
+        self.listing_errors = 0
+        self.refetch_queue = []  # Files that failed validation, downloaded again at the end of the transfer
+        self.refetch_counts = {}
+        self.invalid_files = 0  # Files that never arrived intact, not kept
+        self.kept_invalid = []  # Files kept as the card serves them although their content failed validation
+        self.max_workers = 1
+        self.engine = 'serial'
 
     # Method to set parameters for the operation
     def set_params(self, path, url, start_time, show_progress, verbose,
-                   overwrite, keep_old, ssid, psk, ignore, retries, connection_delay, debug):
+                   overwrite, keep_old, ssid, psk, ignore, retries, connection_delay, debug, incremental=True, max_workers=1,
+                   engine='serial', timeout=DEFAULT_TIMEOUT, keep_alive=True,
+                   chunk_size=DEFAULT_CHUNK_SIZE, durability='batched',
+                   performance_report=False, ready_timeout=READY_TIMEOUT, wifi_backend=None):
         # Configure logging level
         log_level = logging.DEBUG if debug else logging.INFO if verbose else logging.WARN
         logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -54,15 +87,32 @@ class ezShare:
         self.ssid = ssid
         self.psk = psk
         self.connection_id = None
-        self.platform_system = 'Darwin'  # Hardcoded for macOS
+        self.platform_system = platform.system()
+        self.wifi_backend = wifi_backend
         self.interface_name = None
         self.connected = False
-        self.session = requests.Session()
         self.ignore = ['.', '..', 'back to photo'] + ignore
         self.retries = retries
-        self.retry = retry.Retry(total=retries, backoff_factor=0.25)
         self.connection_delay = connection_delay
-        self.session.mount('http://', adapters.HTTPAdapter(max_retries=self.retry))
+        # Seconds to poll the card for after joining its network; 0 falls back to sleeping connection_delay
+        self.ready_timeout = ready_timeout
+        self.incremental = incremental
+        self.max_workers = max(1, int(max_workers))
+        self.engine = engine
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self.chunk_size = max(4096, int(chunk_size))
+        if durability not in DURABILITY_MODES:
+            logging.warning('Unknown durability mode %r, using strict', durability)
+            durability = 'strict'
+        self.durability = durability
+        # Timing is only collected when a report was asked for
+        self.tracer = Tracer([LoggingSink(), JsonReportSink(self.path / REPORT_FILENAME)]) if performance_report else Tracer()
+        # Each configured run gets a fresh token, so an earlier cancel does not stop it
+        self.cancel_token = CancelToken()
+        # One pooled keep-alive connection per concurrent download plus one for listings
+        self.session = create_session(retries=retries, pool_size=self.max_workers + 1,
+                                      timeout=timeout, keep_alive=keep_alive)
 
     # Set the progress callback function
     def set_progress_callback(self, callback):
@@ -77,12 +127,18 @@ class ezShare:
         if self.progress_callback:
             # Ensure the progress value is clamped between 0 and 100
             clamped_value = min(max(0, value), 100)
-            self.progress_callback(clamped_value)
+            with self.tracer.span('signal'):
+                self.progress_callback(clamped_value)
 
     # Update status by calling the callback function
     def update_status(self, message):
         if self.status_callback:
-            self.status_callback(message)
+            with self.tracer.span('signal'):
+                self.status_callback(message)
+
+    # Ask a running sync to stop; it finishes the chunk in hand, publishes completed files and leaves the card's network
+    def cancel(self):
+        self.cancel_token.cancel()
 
     # Print status message and update status
     def print(self, message):
@@ -90,28 +146,23 @@ class ezShare:
             print(message)
         self.update_status(message)
 
-    # Main method to run the file transfer process
+    # Main method to run the file transfer process; returns True if the transfer phase completed.
+    # Without an SSID the card is assumed to be reachable on the current network already.
     def run(self):
+        self.tracer.start()
         self.update_status('Starting process...')
+        self.processed_files = 0
+        self.listing_errors = 0
+        self.refetch_queue = []
+        self.refetch_counts = {}
+        self.invalid_files = 0
+        self.kept_invalid = []
+        self.ready_latency = None
+        self.home_network = None
+        self.cancel_latency = None
         try:
-            if self.ssid:
-                self.update_status(f'Connecting to {self.ssid}...')
-                self.print(f'Connecting to {self.ssid}.')
-                try:
-                    connect_to_wifi(self)
-                    self.update_status(f'Connected to {self.ssid}.')
-                except RuntimeError as e:
-                    self.update_status(f'Failed to connect to {self.ssid}.')
-                    logging.warning('Failed to connect to %s. Error: %s', self.ssid, str(e))
-                    return
-
-                self.print('Waiting a few seconds for connection to establish...')
-                time.sleep(self.connection_delay)
-
-            if not wifi_connected(self):
-                self.update_status('Unable to connect automatically, please connect manually.')
-                logging.warning('No Wi-Fi connection was established. Attempting to continue...')
-                return
+            if not self.join_card_network():
+                return False
 
             try:
                 self.path.mkdir(parents=True, exist_ok=True)
@@ -120,33 +171,175 @@ class ezShare:
                 self.update_status(f'Path {self.path} already exists and is a file. Unable to continue.')
                 sys.exit(f'Path {self.path} already exists and is a file. Unable to continue.')
 
-            # Calculate total files
-            self.update_status('Calculating total files...')
-            self.total_files = self.calculate_total_files(self.url, self.path, self.overwrite)
-            self.update_status(f'Total files to sync: {self.total_files}')
-            self.update_status('Starting file transfer...')
-            self.processed_files = recursive_traversal(self, self.url, self.path, self.total_files, self.processed_files)
+            with self.tracer.span('index_open'):
+                self.open_sync_index()
+
+            since = self.incremental_since()
+            if self.engine == 'pipelined':
+                # Listing and downloading overlap; the manifest and total fill in as the crawl proceeds
+                self.update_status('Listing and downloading files...')
+                with self.tracer.span('pipeline'):
+                    self.processed_files = pipelined_traversal(self, self.url, self.path, self.processed_files, since=since)
+            else:
+                # Crawl the card once; the manifest feeds both the file count and the transfer
+                self.update_status('Listing files on card...')
+                with self.tracer.span('crawl'):
+                    self.manifest = build_manifest(self, self.url, self.path, since=since)
+                self.update_status('Calculating total files...')
+                pending = pending_files(self, self.manifest)
+                self.total_files = len(pending)
+                self.byte_progress.reset(sum(file_weight(entry.size) for entry in pending))
+                self.update_status(f'Total files to sync: {self.total_files}')
+                self.update_status('Starting file transfer...')
+                with self.tracer.span('transfer', files=self.total_files):
+                    self.processed_files = recursive_traversal(self, self.url, self.path, self.total_files,
+                                                               self.processed_files, manifest=pending)
+            self.report_validation()
+            with self.tracer.span('session_index'):
+                self.index_sessions()
+            self.record_synced_night()
             self.update_status('File transfer completed.')
+            return True
+        except Cancelled:
+            # Completed files were published on the way out; interrupted ones keep their .ezpart for a resume
+            self.update_status('Sync cancelled.')
+            return False
         finally:
-            self.disconnect_from_wifi()
+            self.close_sync_index()
+            logging.info('HTTP connections: %s', connection_stats(self.session))
+            self.tracer.set_counters('http_connections', connection_stats(self.session))
+            with self.tracer.span('wifi_disconnect'):
+                self.disconnect_from_wifi()
+            if self.home_network:
+                self.tracer.set_counters('home_network', self.home_network)
             self.update_status('Disconnected from Wi-Fi.')
+            if self.cancel_token.cancelled:
+                # Cancel-to-idle: from the request until files, index and Wi-Fi are all settled
+                self.cancel_latency = self.cancel_token.elapsed()
+                logging.info('Cancelled sync wound down in %.2fs', self.cancel_latency)
+                self.tracer.set_counters('cancel', {'seconds': round(self.cancel_latency, 3)})
+                self.update_status(f'Sync cancelled, stopped cleanly in {self.cancel_latency:.1f}s.')
+            self.tracer.finish()
+
+    # Join the card's network and wait until ready_url (the sync URL by default) answers.
+    # Without an SSID the card is assumed to be reachable already. Returns False if the card could not be reached.
+    def join_card_network(self, ready_url=None):
+        if not self.ssid:
+            return True
+        self.cancel_token.check()
+        self.update_status(f'Connecting to {self.ssid}...')
+        self.print(f'Connecting to {self.ssid}.')
+        try:
+            with self.tracer.span('wifi_connect'):
+                connect_to_wifi(self)
+            self.update_status(f'Connected to {self.ssid}.')
+        except RuntimeError as e:
+            self.update_status(f'Failed to connect to {self.ssid}.')
+            logging.warning('Failed to connect to %s. Error: %s', self.ssid, str(e))
+            return False
+
+        if not wifi_connected(self):
+            self.update_status('Unable to connect automatically, please connect manually.')
+            logging.warning('No Wi-Fi connection was established. Attempting to continue...')
+            return False
+        return self.wait_until_ready(ready_url or self.url)
+
+    # Wait until the card answers over HTTP after joining its network, so the sync starts as soon as the link is up
+    def wait_until_ready(self, url):
+        if not self.ready_timeout:
+            self.print('Waiting a few seconds for connection to establish...')
+            with self.tracer.span('connection_delay'):
+                self.cancel_token.sleep(self.connection_delay)
+            return True
+        self.print('Waiting for the card to respond...')
+        with self.tracer.span('card_ready'):
+            self.ready_latency = wait_for_card(url, self.ready_timeout, cancel_token=self.cancel_token)
+        if self.ready_latency is None:
+            self.update_status(f'The card did not respond within {self.ready_timeout:g} seconds.')
+            return False
+        self.tracer.set_counters('card_ready', {'seconds': round(self.ready_latency, 3)})
+        self.update_status(f'Card ready {self.ready_latency:.1f}s after joining {self.ssid}.')
+        return True
+
+    # Open the persistent sync index in the target path and reconcile it with the files on disk
+    def open_sync_index(self):
+        try:
+            self.sync_index = SyncIndex(self.path)
+            self.sync_index.repair()
+        except sqlite3.Error as e:
+            logging.warning('Sync index unavailable, falling back to file checks: %s', e)
+            self.sync_index = None
+
+    # Night to resume DATALOG listing from, or None for a full crawl
+    def incremental_since(self):
+        if not self.incremental or self.overwrite or not self.sync_index:
+            return None
+        since = self.sync_index.get_meta('last_synced_night')
+        # Go back far enough to restore files that were deleted or changed locally in older nights
+        stale_night = self.sync_index.oldest_stale_night()
+        if since and stale_night and stale_night < since:
+            logging.info('Files in night %s no longer match the index, listing from there', stale_night)
+            since = stale_night
+        if since:
+            self.update_status(f'Incremental sync from night {since}...')
+        return since
+
+    # Remember the newest night once every listing succeeded and every pending file was transferred
+    def record_synced_night(self):
+        if not self.sync_index or self.listing_errors or self.processed_files < self.total_files:
+            return
+        night = latest_night(self.manifest)
+        if night:
+            self.sync_index.set_meta('last_synced_night', night)
+
+    # Tell the user about files that failed validation; those not kept are downloaded again on the next run
+    def report_validation(self):
+        self.tracer.set_counters('validation', {'refetched': len(self.refetch_counts), 'invalid': self.invalid_files,
+                                                'kept_invalid': [str(path) for path in self.kept_invalid]})
+        if self.kept_invalid:
+            self.update_status(f'{len(self.kept_invalid)} files are inconsistent on the card and were kept as they are.')
+        if self.invalid_files:
+            self.update_status(f'{self.invalid_files} files failed validation and will be downloaded again next time.')
+
+    # Add the headers of newly synced DATALOG EDF files to the session index, so later lookups need no directory scan.
+    # Files left over from a cancelled run are picked up by the next one.
+    def index_sessions(self):
+        if not self.sync_index:
+            return
+        indexed = unreadable = 0
+        for local_path in self.sync_index.unindexed_sessions():
+            self.cancel_token.check()
+            try:
+                header = read_header(local_path)
+            except ValueError as e:
+                logging.warning('Could not read the EDF header of %s: %s', local_path, e)
+                header = None
+            except OSError as e:
+                logging.warning('Could not index %s: %s', local_path, e)
+                continue
+            night = local_path.parent.name if is_night_folder(local_path.parent) else None
+            self.sync_index.record_session(local_path, night, header)
+            if header is None:
+                unreadable += 1
+            else:
+                indexed += 1
+        self.sync_index.flush()
+        if indexed or unreadable:
+            logging.info('Session index: %d EDF headers added, %d unreadable', indexed, unreadable)
+        self.tracer.set_counters('session_index', {'indexed': indexed, 'unreadable': unreadable})
+
+    def close_sync_index(self):
+        if self.sync_index:
+            self.tracer.set_counters('sync_index', self.sync_index.stats())
+            try:
+                self.sync_index.close()
+            except sqlite3.Error as e:
+                logging.warning('Error closing sync index: %s', e)
+            self.sync_index = None
 
-    # Recursively calculate the total number of files to be transferred
-    def calculate_total_files(self, url, dir_path, overwrite):
-        total_files = 0
-        files, dirs = list_dir(self, url)
-        for filename, _, file_ts in files:
-            local_path = dir_path / filename
-            if overwrite or not local_path.is_file() or local_path.stat().st_mtime < file_ts:
-                total_files += 1
-        for dirname, dir_url in dirs:
-            new_dir_path = dir_path / dirname
-            absolute_dir_url = urllib.parse.urljoin(url, dir_url)
-            total_files += self.calculate_total_files(absolute_dir_url, new_dir_path, overwrite)
-        return total_files
-
-    # Disconnect from Wi-Fi
+    # Disconnect from Wi-Fi; does nothing if already disconnected
     def disconnect_from_wifi(self):
+        was_connected = self.connection_id is not None
         try:
             disconnect_from_wifi(self)
         except RuntimeError as e:
@@ -154,3 +347,5 @@ class ezShare:
         finally:
             self.connected = False
             self.connection_id = None
+        if was_connected and self.home_network and self.home_network['network']:
+            self.update_status(f"Back on {self.home_network['network']} after {self.home_network['seconds']:.1f}s.")
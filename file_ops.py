@@ -1,39 +1,247 @@
 # file_ops.py
 import pathlib
 import requests
+import urllib3
 import datetime
-import bs4
+import html as html_module
 import urllib.parse
 import re
 import os
+import struct
 import logging
-from tempfile import NamedTemporaryFile
+import collections
+import concurrent.futures
+import ctypes
+import functools
+import sys
+import threading
+import time
+from durability import StagedBatch
+from cancellation import Cancelled
+from edf import EdfStreamValidator, FIXED_HEADER_SIZE, SIGNAL_HEADER_SIZE
+from progress import file_weight
 
 logger = logging.getLogger(__name__)
 
-# Recursively traverse directories and download files
-def recursive_traversal(ezshare, url, dir_path, total_files, processed_files):
-    files, dirs = list_dir(ezshare, url)
-    processed_files = check_files(ezshare, files, url, dir_path, total_files, processed_files)
-    processed_files = check_dirs(ezshare, dirs, url, dir_path, total_files, processed_files)
+# A single file on the card: local destination, absolute download URL, listed size in bytes, timestamp,
+# and the unit the listing showed the size in (e.g. 1024 for "12KB"), which is how far the real size may differ
+RemoteFile = collections.namedtuple('RemoteFile', ['path', 'url', 'size', 'ts', 'size_unit'])
+
+# Multipliers for the size column of the card's directory listing
+SIZE_UNITS = {'': 1, 'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+SIZE_PATTERN = re.compile(r'(\d+)\s*([KMG]?B)?')
+
+# One listing line: "2024- 1- 2   22: 0: 0      12KB  <a href="download?file=...">NAME</a>".
+# Links without a date and size, such as "back to photo", still match, with no timestamp or size.
+LISTING_LINE_PATTERN = re.compile(
+    r'(?:(\d+)-\s*(\d+)-\s*(\d+)\s+(\d+):\s*(\d+):\s*(\d+)\s+'
+    r'(?:(\d+)\s*([KMG]?B)?|&lt;DIR&gt;)?\s*)?'
+    r'<a href="([^"]*)">([^<]*)</a>')
+
+# Suffix of partial downloads kept for resuming
+PARTIAL_SUFFIX = '.ezpart'
+# Small file next to a partial holding the remote timestamp it was started for, so a killed run can resume it
+PARTIAL_MARKER_SUFFIX = '.ts'
+
+# First and longest wait between attempts to resume a dropped transfer, doubling in between
+RESUME_BACKOFF = (0.5, 5.0)
+
+CONTENT_RANGE_PATTERN = re.compile(r'bytes (\d+)-\d+/(\d+|\*)')
+
+# Errors that mean the link dropped mid-transfer rather than the request or file being bad
+TRANSFER_INTERRUPTED = (requests.ConnectionError, requests.Timeout, urllib3.exceptions.HTTPError,
+                        ConnectionError, TimeoutError)
+
+# Ways a transfer can stop with its partial kept for a later resume
+TRANSFER_STOPPED = TRANSFER_INTERRUPTED + (Cancelled,)
+
+# A download that completed but failed validation; its partial is discarded and the file queued for a re-fetch
+class IncompleteDownload(ValueError):
+    pass
+
+# Times a file that failed validation is downloaded again later in the same run. On the last attempt a file that
+# arrives complete and matches the listing is kept even if its content is inconsistent, as some are on the card itself.
+MAX_REFETCHES = 2
+refetch_lock = threading.Lock()
+
+# Largest EDF header: the signal count field has four digits
+MAX_EDF_HEADER_SIZE = FIXED_HEADER_SIZE + 9999 * SIGNAL_HEADER_SIZE
+
+# Bytes read from the socket per write; large reads keep the Python-level loop short
+DEFAULT_CHUNK_SIZE = 256 * 1024
+download_buffers = threading.local()
+
+# ResMed cards keep one DATALOG/YYYYMMDD folder per night
+DAY_FOLDER_PATTERN = re.compile(r'\d{8}')
+
+# Download every file in the manifest, crawling the card first if no manifest was given
+def recursive_traversal(ezshare, url, dir_path, total_files, processed_files, manifest=None):
+    if manifest is None:
+        manifest = pending_files(ezshare, build_manifest(ezshare, url, dir_path))
+    processed_files = check_files(ezshare, manifest, total_files, processed_files)
+    return refetch_invalid(ezshare, total_files, processed_files)
+
+# Download again the files that failed validation, until they pass or run out of re-fetches
+def refetch_invalid(ezshare, total_files, processed_files):
+    while ezshare.refetch_queue:
+        with refetch_lock:
+            entries, ezshare.refetch_queue = ezshare.refetch_queue, []
+        ezshare.update_status(f'Downloading {len(entries)} files again that did not pass validation...')
+        processed_files = check_files(ezshare, entries, total_files, processed_files)
     return processed_files
 
+# Queue an entry that failed validation for another download later in this run, up to MAX_REFETCHES times
+def queue_refetch(ezshare, entry, error):
+    with refetch_lock:
+        attempts = ezshare.refetch_counts.get(entry.path, 0)
+        if attempts >= MAX_REFETCHES:
+            ezshare.invalid_files += 1
+            logger.error('%s failed validation %d times, giving up: %s', entry.path, attempts + 1, error)
+            return
+        ezshare.refetch_counts[entry.path] = attempts + 1
+        ezshare.refetch_queue.append(entry)
+    logger.warning('%s failed validation, downloading it again later: %s', entry.path, error)
+    # The second download counts towards progress like a new file
+    ezshare.byte_progress.add_total(file_weight(entry.size))
+
+# Crawl the card once and return a flat list of RemoteFile entries, directory by directory.
+# With since (YYYYMMDD), DATALOG night folders older than that date are not listed at all.
+def build_manifest(ezshare, url, dir_path, manifest=None, since=None):
+    if manifest is None:
+        manifest = []
+    files, dirs = list_dir(ezshare, url)
+    entries, subdirs = expand_listing(url, dir_path, files, dirs, since)
+    manifest.extend(entries)
+    for absolute_dir_url, new_dir_path in subdirs:
+        build_manifest(ezshare, absolute_dir_url, new_dir_path, manifest, since)
+    return manifest
+
+# Turn one directory listing into RemoteFile entries and the (url, local path) subdirectories to descend into
+def expand_listing(url, dir_path, files, dirs, since=None):
+    entries = []
+    for filename, file_url, file_ts, file_size, size_unit in files:
+        absolute_file_url = urllib.parse.urljoin(url, f'download?{file_url}')
+        entries.append(RemoteFile(dir_path / filename, absolute_file_url, file_size, file_ts, size_unit))
+    subdirs = []
+    for dirname, dir_url in dirs:
+        if since and is_night_folder(dir_path / dirname) and dirname < since:
+            continue
+        subdirs.append((urllib.parse.urljoin(url, dir_url), dir_path / dirname))
+    return entries, subdirs
+
+# Check whether a local directory path is a DATALOG/YYYYMMDD night folder
+def is_night_folder(dir_path):
+    return dir_path.parent.name.upper() == 'DATALOG' and DAY_FOLDER_PATTERN.fullmatch(dir_path.name) is not None
+
+# Return the most recent DATALOG night (YYYYMMDD) present in a manifest, or None
+def latest_night(manifest):
+    nights = [entry.path.parent.name for entry in manifest if is_night_folder(entry.path.parent)]
+    return max(nights) if nights else None
+
+# Check whether a listed file is missing locally or older than the copy on the card
+def needs_download(ezshare, entry):
+    if ezshare.overwrite or ezshare.keep_old:
+        return True
+    sync_index = ezshare.sync_index
+    if sync_index and sync_index.is_current(entry):
+        return False
+
+    local_path = entry.path
+    if not local_path.is_file() or local_path.stat().st_mtime < entry.ts:
+        return True
+    # Up to date on disk but unknown to the index, remember it so the next run is a lookup
+    if sync_index:
+        sync_index.record(entry)
+    return False
+
+# Reduce a manifest to the entries that actually need transferring
+def pending_files(ezshare, manifest):
+    return [entry for entry in manifest if needs_download(ezshare, entry)]
+
+# Convert the size column of a listing line (e.g. "12KB") to bytes and the bytes in its unit, (None, None) if not shown
+def parse_size(text):
+    match = SIZE_PATTERN.search(text)
+    if not match:
+        return None, None
+    unit = SIZE_UNITS[match.group(2) or '']
+    return int(match.group(1)) * unit, unit
+
+# Listings round sizes to the unit they show, so a real size only has to be within one unit of the listed one
+def matches_listed_size(size, listed_size, size_unit=1):
+    return listed_size is None or abs(size - listed_size) < (size_unit or 1)
+
 # List files and directories at the given URL
 def list_dir(ezshare, url):
-    try:
-        html_content = requests.get(url, timeout=5)
-        soup = bs4.BeautifulSoup(html_content.text, 'html.parser')
-    except requests.RequestException as e:
-        logger.error(f"Error fetching directory listing from {url}: {e}")
-        return [], []
+    ezshare.cancel_token.check()
+    with ezshare.tracer.span('listing', url=url):
+        try:
+            html_content = ezshare.session.get(url)
+        except requests.RequestException as e:
+            logger.error(f"Error fetching directory listing from {url}: {e}")
+            ezshare.listing_errors += 1
+            return [], []
+        return parse_listing(html_content.text, ezshare.ignore)
+
+# Split a listing page into (name, query, ts, size, size unit) files and (name, href) directories
+def parse_listing(html, ignore):
+    entries = parse_listing_pre(html)
+    if entries is None:
+        logger.debug('Listing did not match the ez Share <pre> format, falling back to BeautifulSoup')
+        entries = parse_listing_soup(html)
 
     files = []
     dirs = []
+    for link_text, link_href, file_ts, file_size, size_unit in entries:
+        if link_text == 'STR.EDF':
+            link_text = 'STR.edf'
+        if link_text in ignore or link_text.startswith('.'):
+            continue
+
+        path, _, query = link_href.partition('?')
+        if path.endswith('download'):
+            files.append((link_text, query, file_ts, file_size, size_unit))
+        elif path.endswith('dir'):
+            dirs.append((link_text, link_href))
+    return files, dirs
+
+# Parse the card's <pre> listing with one compiled regex, None if the page does not look as expected
+def parse_listing_pre(html):
+    pre_start = html.find('<pre>')
+    pre_end = html.find('</pre>', pre_start)
+    if pre_start < 0 or pre_end < 0:
+        return None
+    pre_text = html[pre_start + 5:pre_end]
+
+    entries = []
+    for match in LISTING_LINE_PATTERN.finditer(pre_text):
+        year, month, day, hour, minute, second, size, unit, href, name = match.groups()
+        file_ts = datetime.datetime(int(year), int(month), int(day),
+                                    int(hour), int(minute), int(second)).timestamp() if year else 0
+        size_unit = SIZE_UNITS[unit or ''] if size else None
+        file_size = int(size) * size_unit if size else None
+        if '&' in name:
+            name = html_module.unescape(name)
+        if '&' in href:
+            href = html_module.unescape(href)
+        entries.append((name.strip(), href, file_ts, file_size, size_unit))
+
+    # Any link the regex could not account for means unfamiliar firmware output
+    if len(entries) != pre_text.count('<a '):
+        return None
+    return entries
+
+# Parse a listing line by line with BeautifulSoup, tolerant of unexpected markup
+def parse_listing_soup(html):
+    import bs4
 
-    pre_text = soup.find('pre').decode_contents()
-    lines = pre_text.split('\n')
+    soup = bs4.BeautifulSoup(html, 'html.parser')
+    pre = soup.find('pre')
+    if pre is None:
+        logger.warning('Directory listing has no <pre> block')
+        return []
 
-    for line in lines:
+    entries = []
+    for line in pre.decode_contents().split('\n'):
         if line.strip():
             parts = line.rsplit(maxsplit=2)
             modifypart = parts[0].replace('- ', '-0').replace(': ', ':0')
@@ -41,82 +249,360 @@ def list_dir(ezshare, url):
 
             match = re.search(regex_pattern, modifypart)
             file_ts = datetime.datetime.strptime(match.group(), '%Y-%m-%d   %H:%M:%S').timestamp() if match else 0
+            file_size, size_unit = parse_size(modifypart[match.end():].split('<a')[0]) if match else (None, None)
 
-            soupline = bs4.BeautifulSoup(line, 'html.parser')
-            link = soupline.a
+            link = bs4.BeautifulSoup(line, 'html.parser').a
             if link:
-                link_text = link.get_text(strip=True)
-                if link_text == 'STR.EDF':
-                    link_text = 'STR.edf'
-
-                link_href = link['href']
-                if link_text in ezshare.ignore or link_text.startswith('.'):
-                    continue
-
-                parsed_url = urllib.parse.urlparse(link_href)
-                if parsed_url.path.endswith('download'):
-                    files.append((link_text, parsed_url.query, file_ts))
-                elif parsed_url.path.endswith('dir'):
-                    dirs.append((link_text, link_href))
-    return files, dirs
+                entries.append((link.get_text(strip=True), link['href'], file_ts, file_size, size_unit))
+    return entries
 
-# Check files and download if necessary
-def check_files(ezshare, files, url, dir_path: pathlib.Path, total_files, processed_files):
-    for filename, file_url, file_ts in files:
-        local_path = dir_path / filename
-        absolute_file_url = urllib.parse.urljoin(url, f'download?{file_url}')
-        progress_msg = f'Downloading file "{filename}" {processed_files + 1}/{total_files}'
-        ezshare.update_status(progress_msg + (f" ({int((processed_files + 1) / total_files * 100)}%)" if total_files else " (0%)"))
+# Check files and download if necessary, through a worker pool when more than one transfer is allowed
+def check_files(ezshare, manifest, total_files, processed_files):
+    if ezshare.max_workers > 1 and len(manifest) > 1:
+        return check_files_parallel(ezshare, manifest, total_files, processed_files)
 
-        if download_file(ezshare, absolute_file_url, local_path, file_ts):
-            processed_files += 1
-            progress_value = (processed_files / total_files) * 100  # Calculate progress percentage
-            ezshare.update_progress(progress_value)
+    for directory, entries in group_by_directory(manifest).items():
+        batch = new_batch(ezshare, directory)
+        try:
+            for entry in entries:
+                ezshare.update_status(transfer_status(ezshare, 'Downloading', entry, processed_files + 1, total_files))
+                # Progress itself is byte-weighted and reported from the transfer loop
+                if fetch_entry(ezshare, entry, batch):
+                    processed_files += 1
+                    # Kept current on ezshare so a cancelled run still reports what it completed
+                    ezshare.processed_files = processed_files
+        finally:
+            publish_batch(ezshare, batch, entries)
+    return processed_files
+
+# Run up to ezshare.max_workers downloads at once; progress is reported from the calling thread.
+# A directory's batch is published as soon as its last file finishes.
+def check_files_parallel(ezshare, manifest, total_files, processed_files):
+    ezshare.update_status(f'Downloading {len(manifest)} files, {ezshare.max_workers} at a time...')
+    groups = group_by_directory(manifest)
+    batches = {directory: new_batch(ezshare, directory) for directory in groups}
+    remaining = {directory: len(entries) for directory, entries in groups.items()}
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=ezshare.max_workers,
+                                                   thread_name_prefix='ezshare-download') as pool:
+            futures = {pool.submit(fetch_entry, ezshare, entry, batches[entry.path.parent]): entry for entry in manifest}
+            for future in concurrent.futures.as_completed(futures):
+                entry = futures[future]
+                try:
+                    fetched = future.result()
+                except Cancelled:
+                    # Files not started yet are dropped; the ones in flight stop at their next chunk
+                    pool.shutdown(wait=True, cancel_futures=True)
+                    raise
+                if fetched:
+                    processed_files += 1
+                    ezshare.processed_files = processed_files
+                    ezshare.update_status(transfer_status(ezshare, 'Downloaded', entry, processed_files, total_files))
+                directory = entry.path.parent
+                remaining[directory] -= 1
+                if not remaining[directory]:
+                    publish_batch(ezshare, batches[directory], groups[directory])
+    finally:
+        # Directories whose last file finished were published above
+        for directory, batch in batches.items():
+            if remaining[directory]:
+                publish_batch(ezshare, batch, groups[directory])
     return processed_files
 
-# Download the specified file
-def download_file(ezshare, url, file_path: pathlib.Path, file_ts=None):
-    if file_path.is_file() and not (ezshare.overwrite or file_path.stat().st_mtime < file_ts) and not ezshare.keep_old:
-        logger.info('File %s already exists and has not been updated. Skipping because overwrite is off.', str(file_path))
+# Per-file status line with the byte-weighted percentage and, once measured, throughput and time left
+def transfer_status(ezshare, verb, entry, processed_files, total_files):
+    rate = ezshare.byte_progress.describe()
+    return (f'{verb} file "{entry.path.name}" {processed_files}/{total_files} ({int(ezshare.byte_progress.percent)}%)'
+            + (f' - {rate}' if rate else ''))
+
+# Group manifest entries by local directory, keeping crawl order
+def group_by_directory(manifest):
+    groups = {}
+    for entry in manifest:
+        groups.setdefault(entry.path.parent, []).append(entry)
+    return groups
+
+# A staging batch for one directory in batched durability mode, None in strict mode
+def new_batch(ezshare, directory):
+    return StagedBatch(directory) if ezshare.durability == 'batched' else None
+
+# Make a directory's staged files durable and visible, then record them in the sync index
+def publish_batch(ezshare, batch, entries):
+    if batch is None:
+        return
+    with ezshare.tracer.span('publish', directory=str(batch.directory)):
+        published = set(batch.commit())
+    if ezshare.sync_index and published:
+        for entry in entries:
+            if entry.path in published:
+                ezshare.sync_index.record(entry)
+
+# Download one manifest entry; in strict mode it is in place and indexed on return, otherwise staged in batch
+def fetch_entry(ezshare, entry, batch=None):
+    local_path = entry.path
+    local_path.parent.mkdir(parents=True, exist_ok=True)
+    progress = ezshare.byte_progress.file(entry.size)
+    last_attempt = ezshare.refetch_counts.get(entry.path, 0) >= MAX_REFETCHES
+    try:
+        if not download_file(ezshare, entry.url, local_path, entry.ts, batch=batch, progress=progress,
+                             listed_size=entry.size, size_unit=entry.size_unit, keep_invalid=last_attempt):
+            return False
+    except IncompleteDownload as e:
+        queue_refetch(ezshare, entry, e)
+        return False
+    finally:
+        progress.finish()
+    if batch is None and ezshare.sync_index:
+        ezshare.sync_index.record(entry)
+    return True
+
+# Download the specified file, streaming straight from the socket into a reused buffer.
+# Bytes land in a persistent <name>.ezpart file; a dropped transfer is resumed with a Range request.
+# With a batch the finished file is staged there instead of being fsynced and renamed here.
+# Raises IncompleteDownload when the file arrived but is truncated or does not match the listing.
+# With keep_invalid a complete file whose EDF content is inconsistent is kept and listed in ezshare.kept_invalid.
+def download_file(ezshare, url, file_path: pathlib.Path, file_ts=None, batch=None, progress=None, listed_size=None,
+                  size_unit=1, keep_invalid=False):
+    part_path = partial_path(file_path)
+    attempts = max(0, ezshare.retries or 0) + 1
+    for attempt in range(1, attempts + 1):
+        try:
+            complete = fetch_partial(ezshare, url, file_path, part_path, file_ts, durable=batch is None,
+                                     progress=progress, listed_size=listed_size, size_unit=size_unit,
+                                     keep_invalid=keep_invalid)
+            break
+        except TRANSFER_INTERRUPTED as e:
+            logger.warning('Transfer of %s interrupted (attempt %d/%d): %s', file_path, attempt, attempts, e)
+            if attempt < attempts:
+                # Give a dropped Wi-Fi link time to come back; a cancel ends the wait at once
+                ezshare.cancel_token.sleep(min(RESUME_BACKOFF[1], RESUME_BACKOFF[0] * 2 ** (attempt - 1)))
+    else:
+        logger.error('Error downloading file %s: giving up, partial data kept for the next run', file_path)
+        return False
+    if not complete:
         return False
 
-    logger.debug('Downloading %s from %s', str(file_path), url)
     try:
-        response = ezshare.session.get(url, stream=True)
+        if batch is not None:
+            batch.add(part_path, file_path, file_ts)
+            logger.info('%s staged', str(file_path))
+            return True
+        part_path.replace(file_path)
+        logger.info('%s written', str(file_path))
+        if file_ts:
+            os.utime(file_path, (file_ts, file_ts))
+    except OSError as e:
+        logger.error(f'Error downloading file {file_path}: {e}')
+        discard_partial(part_path)
+        return False
+    return True
+
+# Partial downloads sit next to their destination under a recognisable name
+def partial_path(file_path):
+    return file_path.with_name(file_path.name + PARTIAL_SUFFIX)
+
+def partial_marker(part_path):
+    return part_path.with_name(part_path.name + PARTIAL_MARKER_SUFFIX)
+
+# Remote timestamp recorded for a partial when it was started, None if there is no readable marker
+def read_marker(part_path):
+    try:
+        return float(partial_marker(part_path).read_text())
+    except (OSError, ValueError):
+        return None
+
+def discard_partial(part_path):
+    part_path.unlink(missing_ok=True)
+    partial_marker(part_path).unlink(missing_ok=True)
+
+# Bytes of a partial download that can be resumed, 0 if there is none or it belongs to an older copy.
+# A partial is matched to the remote file by its marker, or by its mtime once a transfer was interrupted cleanly.
+def resumable_offset(part_path, file_ts):
+    try:
+        stat = part_path.stat()
+    except OSError:
+        partial_marker(part_path).unlink(missing_ok=True)
+        return 0
+    if file_ts and (stat.st_mtime == file_ts or read_marker(part_path) == file_ts):
+        return stat.st_size
+    discard_partial(part_path)
+    return 0
+
+# Check that a 206 answer continues exactly where the partial ends and return the full file size,
+# taken from Content-Range when there was no Content-Length; None if neither gives it
+def resumed_total_size(response, offset, total_size):
+    match = CONTENT_RANGE_PATTERN.fullmatch(response.headers.get('content-range', '').strip())
+    if not match or int(match.group(1)) != offset:
+        raise ValueError(f'unexpected Content-Range {response.headers.get("content-range")!r} for offset {offset}')
+    advertised = None if match.group(2) == '*' else int(match.group(2))
+    if advertised is not None and total_size is not None and advertised != total_size:
+        raise ValueError(f'Content-Range advertises {advertised} bytes, expected {total_size}')
+    return advertised if total_size is None else total_size
+
+# Fill part_path with the remote file, resuming from what is already there when the card honours Range.
+# Returns True when complete, False on a failure that discarded the partial, and raises
+# TRANSFER_STOPPED when the link dropped or the sync was cancelled, with the partial kept for a resume.
+# The file is validated as it streams in: EDF headers must parse and match the bytes received, and every
+# file must match its listed size; a file that fails raises IncompleteDownload with the partial discarded.
+def fetch_partial(ezshare, url, file_path, part_path, file_ts, durable=True, progress=None, listed_size=None,
+                  size_unit=1, keep_invalid=False):
+    ezshare.cancel_token.check()
+    offset = resumable_offset(part_path, file_ts)
+    started = time.perf_counter()
+    headers = {'Range': f'bytes={offset}-'} if offset else None
+    logger.debug('Downloading %s from %s%s', str(file_path), url, f' resuming at byte {offset}' if offset else '')
+    try:
+        response = ezshare.session.get(url, stream=True, headers=headers)
+        if offset and response.status_code == 416:
+            # Nothing to resume against, e.g. the partial is already as long as the file
+            response.close()
+            discard_partial(part_path)
+            offset = 0
+            response = ezshare.session.get(url, stream=True)
         response.raise_for_status()
+    except TRANSFER_INTERRUPTED:
+        raise
     except requests.RequestException as e:
         logger.error(f'Error downloading file {file_path}: {e}')
         return False
 
-    total_size = int(response.headers.get('content-length', 0))
-    if total_size == 0:
-        logger.warning('File %s has zero total size, skipping progress update.', str(file_path))
-        with file_path.open('wb'):
-            pass
-        return True
-
     try:
-        with NamedTemporaryFile(delete=False, dir=file_path.parent) as tmp_file:
-            for data in response.iter_content(1024):
-                tmp_file.write(data)
-            tmp_file.flush()
-            os.fsync(tmp_file.fileno())
-            tmp_file_path = pathlib.Path(tmp_file.name)
-            tmp_file_path.replace(file_path)
-            logger.info('%s written', str(file_path))
-            if file_ts:
-                os.utime(file_path, (file_ts, file_ts))
+        if offset and response.status_code != 206:
+            logger.info('Card ignored the range request for %s, restarting from the beginning', file_path)
+            offset = 0
+        # Without Content-Length (e.g. a chunked answer) the size is unknown and the body is read to its end
+        content_length = response.headers.get('content-length')
+        total_size = offset + int(content_length) if content_length is not None else None
+        if offset:
+            total_size = resumed_total_size(response, offset, total_size)
+            if progress:
+                progress.resumed(offset)
+        validator = EdfStreamValidator(strict=not keep_invalid) if file_path.suffix.lower() == '.edf' else None
+        if total_size == 0:
+            # An explicit empty answer: an EDF is never empty, and neither is a file the listing shows with a size
+            if validator or listed_size:
+                raise IncompleteDownload('the card sent an empty response')
+            logger.warning('File %s has zero total size, skipping progress update.', str(file_path))
+            with part_path.open('wb'):
+                pass
+            return True
+
+        buffer = read_buffer(ezshare.chunk_size)
+        view = memoryview(buffer)
+        raw = response.raw
+        raw.decode_content = True
+        if file_ts and not offset:
+            partial_marker(part_path).write_text(repr(file_ts))
+        # Unbuffered: each chunk goes from the buffer to the kernel with no intermediate copy
+        with open(part_path, 'r+b' if offset else 'wb', buffering=0) as part_file:
+            if validator and offset:
+                validator.feed(part_file.read(min(offset, MAX_EDF_HEADER_SIZE)))
+            part_file.seek(offset)
+            if total_size:
+                preallocate(part_file.fileno(), total_size)
+            received = offset
+            try:
+                while True:
+                    ezshare.cancel_token.check()
+                    read = raw.readinto(buffer)
+                    if not read:
+                        break
+                    part_file.write(view[:read])
+                    if validator and validator.header is None:
+                        validator.feed(view[:read])
+                    received += read
+                    if progress:
+                        progress.advance(read)
+            except TRANSFER_STOPPED:
+                # Drop any preallocated tail so the size is exactly what was received
+                part_file.truncate(received)
+                part_file.close()
+                if file_ts:
+                    os.utime(part_path, (file_ts, file_ts))
+                raise
+            part_file.truncate(received)
+            if total_size is not None and received != total_size:
+                raise IncompleteDownload(f'received {received} bytes, expected {total_size}')
+            if not matches_listed_size(received, listed_size, size_unit):
+                raise IncompleteDownload(f'received {received} bytes, the card lists {listed_size}')
+            if validator:
+                validator.finish(received)
+                if validator.error:
+                    logger.warning('%s is kept although it failed validation again: %s', file_path, validator.error)
+                    ezshare.kept_invalid.append(file_path)
+            ezshare.tracer.record_file(file_path, received - offset, time.perf_counter() - started)
+            if durable:
+                with ezshare.tracer.span('fsync'):
+                    os.fsync(part_file.fileno())
+        partial_marker(part_path).unlink(missing_ok=True)
+    except TRANSFER_STOPPED:
+        raise
+    except ValueError as e:
+        # Truncated, malformed or not what the listing promised: start over from scratch next time
+        discard_partial(part_path)
+        if isinstance(e, IncompleteDownload):
+            raise
+        raise IncompleteDownload(str(e)) from e
     except Exception as e:
         logger.error(f'Error downloading file {file_path}: {e}')
+        discard_partial(part_path)
         return False
-
+    finally:
+        response.close()
     return True
 
-# Check directories and handle them
-def check_dirs(ezshare, dirs, url, dir_path: pathlib.Path, total_files, processed_files):
-    for dirname, dir_url in dirs:
-        new_dir_path = dir_path / dirname
-        new_dir_path.mkdir(exist_ok=True)
-        absolute_dir_url = urllib.parse.urljoin(url, dir_url)
-        processed_files = recursive_traversal(ezshare, absolute_dir_url, new_dir_path, total_files, processed_files)
-    return processed_files
+# One read buffer per download thread, reallocated only when the chunk size changes
+def read_buffer(size):
+    buffer = getattr(download_buffers, 'buffer', None)
+    if buffer is None or len(buffer) != size:
+        buffer = download_buffers.buffer = bytearray(size)
+    return buffer
+
+# fallocate() flag that allocates blocks without growing the file
+FALLOC_FL_KEEP_SIZE = 1
+
+# macOS fcntl(F_PREALLOCATE) from <sys/fcntl.h>: command, flags, position mode, and the fstore_t layout
+F_PREALLOCATE = 42
+F_ALLOCATECONTIG = 0x2
+F_ALLOCATEALL = 0x4
+F_PEOFPOSMODE = 3
+FSTORE_FORMAT = 'Iiqqq'  # fst_flags, fst_posmode, fst_offset, fst_length, fst_bytesalloc
+
+# Reserve the file's blocks up front: fallocate() on Linux, F_PREALLOCATE on macOS (APFS and HFS+). The file size
+# is left alone either way, so after a crash or kill a partial is still exactly as long as the bytes written.
+def preallocate(fileno, size):
+    if sys.platform == 'darwin':
+        preallocate_macos(fileno, size)
+        return
+    fallocate = load_fallocate()
+    if fallocate is None:
+        return
+    if fallocate(fileno, FALLOC_FL_KEEP_SIZE, 0, size) != 0:
+        logger.debug('Preallocation not supported here: %s', os.strerror(ctypes.get_errno()))
+
+# Ask for contiguous space first and settle for any space, as the filesystem may be fragmented.
+# Allocation starts at the physical end of file, so a resumed partial only reserves what is still to come.
+def preallocate_macos(fileno, size):
+    import fcntl
+    remaining = size - os.fstat(fileno).st_size
+    if remaining <= 0:
+        return
+    for flags in (F_ALLOCATECONTIG | F_ALLOCATEALL, F_ALLOCATEALL):
+        try:
+            fcntl.fcntl(fileno, F_PREALLOCATE, struct.pack(FSTORE_FORMAT, flags, F_PEOFPOSMODE, 0, remaining, 0))
+            return
+        except OSError as e:
+            error = e
+    logger.debug('Preallocation not supported here: %s', error)
+
+@functools.lru_cache(maxsize=None)
+def load_fallocate():
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        fallocate = ctypes.CDLL(None, use_errno=True).fallocate64
+    except (OSError, AttributeError) as e:
+        logger.debug('fallocate not available: %s', e)
+        return None
+    fallocate.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+    return fallocate
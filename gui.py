@@ -1,16 +1,15 @@
-from PySide6.QtWidgets import QMainWindow, QFileDialog, QMessageBox, QProgressBar, QTextEdit
-from PySide6.QtCore import QTimer, QSize, QPoint
+from PySide6.QtWidgets import QApplication, QMainWindow, QFileDialog, QMessageBox, QProgressBar, QTextEdit, QLabel
+from PySide6.QtCore import QEvent, QTimer, QSize, QPoint
 import os
 import pathlib
 import configparser
 import subprocess
-import time
-import requests
 from ui_main import Ui_ezShareCPAP
-from worker import ezShareWorker
-from utils import resource_path, ensure_disk_access, request_accessibility_access, check_oscar_installed, is_dark_mode, load_stylesheet
-from wifi import connect_to_wifi, wifi_connected
-from ezshare import ezShare
+from worker import ezShareWorker, ezShareConfigWorker, BackgroundTask
+from utils import resource_path, probe_disk_access, request_disk_access, request_accessibility_access, check_oscar_installed, is_dark_mode, load_stylesheet
+
+# Settings page served by the card
+EZSHARE_CONFIG_URL = 'http://192.168.4.1/publicdir/index.htm?vtype=0&fdir=&ftype=1&devw=320&devh=356'
 
 class ezShareCPAP(QMainWindow):
     def __init__(self):
@@ -18,13 +17,32 @@ class ezShareCPAP(QMainWindow):
         self.config_file = resource_path('config.ini')
         self.config = configparser.ConfigParser()
         self.worker = None  # Initialize worker to None
-        self.ezshare = ezShare()  # Initialize ezShare instance
+        self.ezshare = None  # Created on first use so the network stack is not imported at startup
+        self.probes = []  # Background probes still running, kept alive until they finish
         self.init_config()  # Initialize configuration with defaults if necessary
         self.initUI()  # Initialize UI
         self.load_config()  # Load the configuration
+        QTimer.singleShot(0, self.run_startup_checks)  # Permission and OSCAR checks run once the window is up
+        QTimer.singleShot(100, self.adjust_height)  # Adjust height after everything is set up with a delay
+
+    def run_startup_checks(self):
         self.request_permissions()
         self.check_oscar_installation(on_launch=True)  # Check for OSCAR installation on launch
-        QTimer.singleShot(100, self.adjust_height)  # Adjust height after everything is set up with a delay
+
+    # Run a blocking probe on a background thread; on_result is called on the GUI thread with its answer
+    def start_probe(self, probe, *args, on_result):
+        task = BackgroundTask(probe, *args)
+        task.result.connect(on_result)
+        task.finished.connect(lambda: self.probes.remove(task))
+        self.probes.append(task)
+        task.start()
+
+    def get_ezshare(self):
+        # Importing ezshare pulls in requests/urllib3, so it waits until a sync or config visit needs it
+        if self.ezshare is None:
+            from ezshare import ezShare
+            self.ezshare = ezShare()
+        return self.ezshare
 
     def init_config(self):
         if not os.path.exists(self.config_file):
@@ -34,7 +52,13 @@ class ezShareCPAP(QMainWindow):
                 'accessibility_checked': 'False',
                 'accessibility_prompt_disabled': 'False',
                 'import_oscar': 'False',
-                'quit_after_completion': 'False'
+                'quit_after_completion': 'False',
+                'incremental': 'True',
+                'max_workers': '3',
+                'engine': 'serial',
+                'chunk_size': '262144',
+                'durability': 'batched',
+                'performance_report': 'False'
             }
             self.config['WiFi'] = {
                 'ssid': 'ez Share',
@@ -57,7 +81,13 @@ class ezShareCPAP(QMainWindow):
                     'accessibility_checked': 'False',
                     'accessibility_prompt_disabled': 'False',
                     'import_oscar': 'False',
-                    'quit_after_completion': 'False'
+                    'quit_after_completion': 'False',
+                    'incremental': 'True',
+                    'max_workers': '3',
+                    'engine': 'serial',
+                    'chunk_size': '262144',
+                    'durability': 'batched',
+                    'performance_report': 'False'
                 }
             if 'WiFi' not in self.config:
                 self.config['WiFi'] = {
@@ -82,13 +112,15 @@ class ezShareCPAP(QMainWindow):
 
         # Status bar message and progress bar
         self.statusBar().showMessage('Ready.')
+        self.rateLabel = QLabel(self)
+        self.statusBar().addPermanentWidget(self.rateLabel)
         self.progressBar = QProgressBar(self)
         self.progressBar.setMaximumWidth(200)
         self.statusBar().addPermanentWidget(self.progressBar)
 
         self.ui.pathBrowseBtn.clicked.connect(self.browse_path)
         self.ui.pathField.mousePressEvent = self.open_path_location  # Override mouse press event
-        self.ui.startBtn.clicked.connect(self.start_process)
+        self.ui.startBtn.clicked.connect(lambda: self.start_process())
         self.ui.saveBtn.clicked.connect(self.save_config)
         self.ui.defaultBtn.clicked.connect(self.restore_defaults)
         self.ui.cancelBtn.clicked.connect(self.cancel_process)
@@ -102,6 +134,7 @@ class ezShareCPAP(QMainWindow):
         self.ui.actionSave_Settings.triggered.connect(self.save_config)
         self.ui.actionQuit.triggered.connect(self.close_event_handler)
         self.ui.actionEz_Share_Config.triggered.connect(self.ez_share_config)
+        self.ui.actionFull_Sync.triggered.connect(lambda: self.start_process(full_sync=True))
         self.ui.actionCheck_Access_Oscar.triggered.connect(lambda: self.check_oscar_installation(on_launch=False))
 
         # Set initial values from config
@@ -110,25 +143,36 @@ class ezShareCPAP(QMainWindow):
         self.ui.ssidEntry.setText(self.config['WiFi'].get('ssid', 'ez Share'))
         self.ui.pskEntry.setText(self.config['WiFi'].get('psk', '88888888'))
         self.ui.quitCheckbox.setChecked(self.config['Settings'].getboolean('quit_after_completion', False))
+        self.ui.workersSpinBox.setValue(self.config['Settings'].getint('max_workers', 3))
 
         self.status_timer = QTimer(self)
         self.status_timer.setSingleShot(True)
         self.status_timer.timeout.connect(self.reset_status)
         self.is_running = False  # Track the status of the download process
 
+        self.theme = None
         self.apply_stylesheet()
         self.adjust_height()  # Adjust height on first opening
 
-        self.dark_mode_timer = QTimer(self)
-        self.dark_mode_timer.timeout.connect(self.apply_stylesheet)
-        self.dark_mode_timer.start(5000)  # Check every 5 seconds
-
-    def apply_stylesheet(self):
-        if is_dark_mode():
-            stylesheet = load_stylesheet("style_dark.qss")
-        else:
-            stylesheet = load_stylesheet("style_light.qss")
-        self.setStyleSheet(stylesheet)
+        # Follow the system appearance as it changes instead of polling for it
+        hints = QApplication.styleHints()
+        if hasattr(hints, 'colorSchemeChanged'):
+            hints.colorSchemeChanged.connect(self.apply_stylesheet)
+
+    # Also covers Qt versions without colorSchemeChanged, where a theme switch arrives as a palette change.
+    # Application-wide palette and theme changes reach event() but not changeEvent().
+    def event(self, event):
+        if event.type() in (QEvent.Type.ApplicationPaletteChange, QEvent.Type.ThemeChange):
+            self.apply_stylesheet()
+        return super().event(event)
+
+    # Styles the whole application, dialogs included; only restyles when the theme actually changed
+    def apply_stylesheet(self, *args):
+        theme = 'dark' if is_dark_mode() else 'light'
+        if theme == self.theme:
+            return
+        self.theme = theme
+        QApplication.instance().setStyleSheet(load_stylesheet(f"style_{theme}.qss"))
 
     def load_config(self):
         self.config.read(self.config_file)
@@ -137,11 +181,13 @@ class ezShareCPAP(QMainWindow):
         self.ui.ssidEntry.setText(self.config['WiFi'].get('ssid', 'ez Share'))
         self.ui.pskEntry.setText(self.config['WiFi'].get('psk', '88888888'))
         self.ui.quitCheckbox.setChecked(self.config['Settings'].getboolean('quit_after_completion', False))
+        self.ui.workersSpinBox.setValue(self.config['Settings'].getint('max_workers', 3))
         self.adjust_height()  # Adjust height after loading config
 
     def save_config(self):
         self.config['Settings']['import_oscar'] = str(self.ui.importOscarCheckbox.isChecked())
         self.config['Settings']['quit_after_completion'] = str(self.ui.quitCheckbox.isChecked())
+        self.config['Settings']['max_workers'] = str(self.ui.workersSpinBox.value())
         # Save window size and position
         self.config['Window']['width'] = str(self.size().width())
         self.config['Window']['height'] = str(self.size().height())
@@ -152,7 +198,11 @@ class ezShareCPAP(QMainWindow):
             self.update_status('Settings saved.', 'info')
 
     def request_permissions(self):
-        ensure_disk_access(self.config['Settings']['path'], self)
+        self.start_probe(probe_disk_access, self.config['Settings']['path'], on_result=self.apply_disk_access)
+
+    def apply_disk_access(self, has_access):
+        if not has_access:
+            request_disk_access(self)
 
     def request_accessibility_access(self):
         request_accessibility_access(self)
@@ -184,7 +234,7 @@ class ezShareCPAP(QMainWindow):
         if expanded_path.is_dir():
             subprocess.run(['open', expanded_path])  # Use 'open' command to open the directory on macOS
 
-    def start_process(self):
+    def start_process(self, full_sync=False):
         path = self.config['Settings']['path']
         url = self.ui.urlEntry.text()
         ssid = self.ui.ssidEntry.text()
@@ -212,8 +262,9 @@ class ezShareCPAP(QMainWindow):
         self.config['WiFi']['psk'] = psk
         self.config['Settings']['import_oscar'] = str(self.ui.importOscarCheckbox.isChecked())
         self.config['Settings']['quit_after_completion'] = str(self.ui.quitCheckbox.isChecked())
+        self.config['Settings']['max_workers'] = str(self.ui.workersSpinBox.value())
 
-        self.ezshare.set_params(
+        self.get_ezshare().set_params(
             path=expanded_path,
             url=url,
             start_time=None,
@@ -226,7 +277,13 @@ class ezShareCPAP(QMainWindow):
             ignore=[],
             retries=3,
             connection_delay=5,
-            debug=True
+            debug=True,
+            incremental=self.config['Settings'].getboolean('incremental', True) and not full_sync,
+            max_workers=self.ui.workersSpinBox.value(),
+            engine=self.config['Settings'].get('engine', 'serial'),
+            chunk_size=self.config['Settings'].getint('chunk_size', 262144),
+            durability=self.config['Settings'].get('durability', 'batched'),
+            performance_report=self.config['Settings'].getboolean('performance_report', False)
         )
 
         if self.worker and self.worker.isRunning():
@@ -236,6 +293,7 @@ class ezShareCPAP(QMainWindow):
         self.disable_ui_elements()
         self.worker = ezShareWorker(self.ezshare)
         self.worker.progress.connect(self.update_progress)
+        self.worker.rate.connect(self.rateLabel.setText)
         self.worker.status.connect(self.update_status)
         self.worker.finished.connect(self.process_finished)
         self.worker.start()
@@ -263,6 +321,11 @@ class ezShareCPAP(QMainWindow):
         self.is_running = False  # Reset the flag when the process finishes
         self.enable_ui_elements()
         self.progressBar.setValue(0)
+        self.rateLabel.clear()
+        if self.ezshare.cancel_token.cancelled:
+            latency = self.ezshare.cancel_latency
+            self.update_status('Process cancelled.' + (f' Stopped cleanly in {latency:.1f}s.' if latency is not None else ''), 'info')
+            return
         if self.ui.importOscarCheckbox.isChecked():
             self.import_cpap_data_with_oscar()
         if self.ui.quitCheckbox.isChecked():
@@ -286,18 +349,17 @@ class ezShareCPAP(QMainWindow):
 
     def cancel_process(self):
         if self.worker and self.worker.isRunning():
+            # The worker winds down by itself; process_finished restores the UI once it has
+            self.update_status('Cancelling...', 'info')
             self.worker.stop()
-            self.worker.wait()  # Ensure the thread finishes properly
-            self.progressBar.setValue(0)
-            self.update_status('Process cancelled.', 'info')
+            return
         self.is_running = False  # Reset the flag when the process is cancelled
         self.enable_ui_elements()
-        if self.ezshare:
-            self.ezshare.disconnect_from_wifi()  # Ensure Wi-Fi is disconnected
 
     def close_event_handler(self):
         if self.worker and self.worker.isRunning():
-            self.cancel_process()
+            self.worker.stop()
+            self.worker.wait()  # Let it leave the card's network before the app exits
         self.update_status('Ready.', 'info')
         self.progressBar.setValue(0)
         self.close()
@@ -316,50 +378,46 @@ class ezShareCPAP(QMainWindow):
             msg.close()
             self.update_status('Starting configuration process...', 'info')
             print("Starting configuration process...")
-            try:
-                self.update_status(f'Connecting to {self.ui.ssidEntry.text()}...', 'info')
-                self.ezshare.set_params(
-                    path=self.config['Settings']['path'],
-                    url=self.config['Settings']['url'],
-                    start_time=None,
-                    show_progress=True,
-                    verbose=True,
-                    overwrite=False,
-                    keep_old=False,
-                    ssid=self.ui.ssidEntry.text(),
-                    psk=self.ui.pskEntry.text(),
-                    ignore=[],
-                    retries=3,
-                    connection_delay=5,
-                    debug=True
-                )
-                connect_to_wifi(self.ezshare)
-
-                # Wait for connection to establish
-                time.sleep(self.ezshare.connection_delay)
-
-                if wifi_connected(self.ezshare):
-                    self.update_status(f'Connected to {self.ui.ssidEntry.text()}.', 'info')
-                    self.update_status('Checking if the ez Share HTTP server is reachable...', 'info')
-                    print("Connected to Wi-Fi, checking HTTP server")
-                    try:
-                        response = requests.get('http://192.168.4.1/publicdir/index.htm?vtype=0&fdir=&ftype=1&devw=320&devh=356', timeout=5)
-                        if response.status_code == 200:
-                            self.update_status('HTTP server is reachable. Opening the configuration page...', 'info')
-                            subprocess.run(['open', 'http://192.168.4.1/publicdir/index.htm?vtype=0&fdir=&ftype=1&devw=320&devh=356'])
-                        else:
-                            self.update_status(f'Failed to reach the HTTP server. Status code: {response.status_code}', 'error')
-                    except requests.RequestException as e:
-                        self.update_status(f'Failed to reach the HTTP server. Error: {e}', 'error')
-                else:
-                    self.update_status('Failed to connect to the ez Share Wi-Fi.', 'error')
-            except RuntimeError as e:
-                self.update_status(f'Error: {e}', 'error')
+            self.get_ezshare().set_params(
+                path=self.config['Settings']['path'],
+                url=self.config['Settings']['url'],
+                start_time=None,
+                show_progress=True,
+                verbose=True,
+                overwrite=False,
+                keep_old=False,
+                ssid=self.ui.ssidEntry.text(),
+                psk=self.ui.pskEntry.text(),
+                ignore=[],
+                retries=3,
+                connection_delay=5,
+                debug=True
+            )
+            # Joining and waiting for the card run on the worker; Cancel stops it like a sync
+            self.disable_ui_elements()
+            self.worker = ezShareConfigWorker(self.ezshare, EZSHARE_CONFIG_URL)
+            self.worker.progress.connect(self.update_progress)
+            self.worker.status.connect(self.update_status)
+            self.worker.finished.connect(self.config_finished)
+            self.worker.start()
+            self.is_running = True
         else:
             self.update_status('Configuration cancelled.', 'info')
 
+    def config_finished(self, ready):
+        self.is_running = False
+        self.enable_ui_elements()
+        self.progressBar.setValue(0)
+        if ready:
+            self.update_status('Opening the configuration page...', 'info')
+            subprocess.run(['open', EZSHARE_CONFIG_URL])
+        elif not self.ezshare.cancel_token.cancelled:
+            self.update_status('Failed to reach the ez Share HTTP server.', 'error')
+
     def closeEvent(self, event):
         self.close_event_handler()
+        for task in list(self.probes):
+            task.wait()  # A QThread must not be destroyed while running
         event.accept()
 
     def restore_defaults(self):
@@ -369,7 +427,13 @@ class ezShareCPAP(QMainWindow):
             'accessibility_checked': 'False',
             'accessibility_prompt_disabled': 'False',
             'import_oscar': 'False',
-            'quit_after_completion': 'False'
+            'quit_after_completion': 'False',
+            'incremental': 'True',
+            'max_workers': '3',
+            'engine': 'serial',
+            'chunk_size': '262144',
+            'durability': 'batched',
+            'performance_report': 'False'
         }
         self.config['WiFi'] = {
             'ssid': 'ez Share',
@@ -389,6 +453,7 @@ class ezShareCPAP(QMainWindow):
         self.ui.pskEntry.setText(self.config['WiFi'].get('psk'))
         self.ui.importOscarCheckbox.setChecked(False)
         self.ui.quitCheckbox.setChecked(False)
+        self.ui.workersSpinBox.setValue(3)
         self.update_status('Settings have been restored to defaults.', 'info')
 
     def update_checkboxes(self):
@@ -399,8 +464,11 @@ class ezShareCPAP(QMainWindow):
         self.ui.quitCheckbox.setChecked(self.config['Settings'].getboolean('quit_after_completion', False))
 
     def check_oscar_installation(self, on_launch=True):
-        """Check if OSCAR is installed, and update the UI accordingly."""
-        oscar_installed = check_oscar_installed()
+        """Check if OSCAR is installed in the background, and update the UI when the answer arrives."""
+        self.start_probe(check_oscar_installed, not on_launch,
+                         on_result=lambda oscar_installed: self.apply_oscar_installation(oscar_installed, on_launch))
+
+    def apply_oscar_installation(self, oscar_installed, on_launch=True):
         if oscar_installed:
             self.ui.importOscarCheckbox.setEnabled(True)
             self.ui.importOscarCheckbox.setChecked(self.config['Settings'].getboolean('import_oscar', False))
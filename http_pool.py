@@ -0,0 +1,108 @@
+# http_pool.py
+import logging
+import threading
+import time
+import requests
+from requests import adapters
+from urllib3 import connection, connectionpool
+from urllib3.util import retry
+
+logger = logging.getLogger(__name__)
+
+# (connect, read) timeout in seconds applied to every request to the card unless one is given explicitly
+DEFAULT_TIMEOUT = (3.05, 10)
+
+# Readiness probe: short per-attempt timeout so a link that is still coming up is retried quickly,
+# with the wait between attempts doubling from the first to the second value
+PROBE_TIMEOUT = (0.5, 2)
+PROBE_BACKOFF = (0.1, 0.5)
+
+# Seconds to wait for the card to answer after joining its network
+READY_TIMEOUT = 30
+
+# HTTP adapter with a default timeout that counts TCP connections opened versus requests sent
+class CardAdapter(adapters.HTTPAdapter):
+    def __init__(self, timeout=DEFAULT_TIMEOUT, **kwargs):
+        self.timeout = timeout
+        self.stats_lock = threading.Lock()
+        self.opened = 0
+        self.requests_sent = 0
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        adapter = self
+
+        # urllib3 silently reconnects a pooled connection the card has closed, so count at connect() itself
+        class CountingConnection(connection.HTTPConnection):
+            def connect(self):
+                super().connect()
+                with adapter.stats_lock:
+                    adapter.opened += 1
+
+        class CountingPool(connectionpool.HTTPConnectionPool):
+            ConnectionCls = CountingConnection
+
+        self.poolmanager.pool_classes_by_scheme = dict(self.poolmanager.pool_classes_by_scheme, http=CountingPool)
+
+    def send(self, request, timeout=None, **kwargs):
+        with self.stats_lock:
+            self.requests_sent += 1
+        return super().send(request, timeout=self.timeout if timeout is None else timeout, **kwargs)
+
+    def connection_stats(self):
+        with self.stats_lock:
+            return {'opened': self.opened, 'reused': max(0, self.requests_sent - self.opened),
+                    'requests': self.requests_sent}
+
+# Build the session used for all card traffic: listings and downloads share one keep-alive pool
+def create_session(retries=3, pool_size=adapters.DEFAULT_POOLSIZE, timeout=DEFAULT_TIMEOUT, keep_alive=True):
+    session = requests.Session()
+    adapter = CardAdapter(timeout=timeout,
+                          pool_connections=1,
+                          pool_maxsize=pool_size,
+                          max_retries=retry.Retry(total=retries, backoff_factor=0.25))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    if not keep_alive:
+        session.headers['Connection'] = 'close'
+    return session
+
+# Connection counters for a session created by create_session()
+def connection_stats(session):
+    adapter = session.get_adapter('http://')
+    if isinstance(adapter, CardAdapter):
+        return adapter.connection_stats()
+    return {'opened': 0, 'reused': 0, 'requests': 0}
+
+# Poll url until the card answers over HTTP or deadline seconds pass.
+# Returns the seconds it took the card to answer, or None if it never did.
+# A cancel_token stops the wait early by raising Cancelled.
+def wait_for_card(url, deadline=READY_TIMEOUT, timeout=PROBE_TIMEOUT, backoff=PROBE_BACKOFF, cancel_token=None):
+    started = time.perf_counter()
+    delay, max_delay = backoff
+    attempts = 0
+    while True:
+        if cancel_token:
+            cancel_token.check()
+        attempts += 1
+        try:
+            # Not sent through the card session, whose retries would hold a single attempt past the deadline
+            response = requests.get(url, timeout=timeout)
+            response.close()
+            if response.status_code < 500:
+                elapsed = time.perf_counter() - started
+                logger.info('Card at %s answered after %.2fs (%d probes)', url, elapsed, attempts)
+                return elapsed
+            logger.debug('Readiness probe %d: HTTP %d', attempts, response.status_code)
+        except requests.RequestException as e:
+            logger.debug('Readiness probe %d failed: %s', attempts, e)
+        remaining = deadline - (time.perf_counter() - started)
+        if remaining <= 0:
+            logger.warning('Card at %s did not answer within %ss (%d probes)', url, deadline, attempts)
+            return None
+        if cancel_token:
+            cancel_token.sleep(min(delay, remaining))
+        else:
+            time.sleep(min(delay, remaining))
+        delay = min(delay * 2, max_delay)
@@ -1,28 +1,51 @@
+import time
+STARTUP_STARTED = time.perf_counter()  # Taken before any heavy import for --profile-startup
+
+import os
 from PySide6.QtWidgets import QApplication
+from PySide6.QtCore import QTimer
 from gui import ezShareCPAP
 import sys
-from utils import is_dark_mode, load_stylesheet, resource_path
+from utils import resource_path
 from PySide6.QtGui import QIcon
 
+IMPORTS_DONE = time.perf_counter()
+
+# Time-to-first-window budget in seconds checked by --profile-startup
+STARTUP_BUDGET = 1.5
+
+# Modules that should only be loaded once a sync starts
+DEFERRED_MODULES = ['requests', 'urllib3', 'bs4', 'ezshare', 'file_ops']
+
+def report_startup(app, window_built):
+    first_window = time.perf_counter() - STARTUP_STARTED
+    loaded_early = [name for name in DEFERRED_MODULES if name in sys.modules]
+    print(f"Startup profile: imports {(IMPORTS_DONE - STARTUP_STARTED) * 1000:.0f} ms, "
+          f"window built {(window_built - STARTUP_STARTED) * 1000:.0f} ms, "
+          f"first window {first_window * 1000:.0f} ms (budget {STARTUP_BUDGET * 1000:.0f} ms)", file=sys.stderr)
+    if loaded_early:
+        print(f"Startup profile: loaded before first sync: {', '.join(loaded_early)}", file=sys.stderr)
+    over_budget = first_window > STARTUP_BUDGET or bool(loaded_early)
+    app.exit(1 if over_budget else 0)
+
 def main():
+    # --profile-startup (or EZSHARE_PROFILE_STARTUP=1) reports startup timings and exits once the window is up
+    profile_startup = '--profile-startup' in sys.argv or os.environ.get('EZSHARE_PROFILE_STARTUP') == '1'
     app = QApplication(sys.argv)
     icon_path = resource_path("icons/main.png")
     print(f"Setting application icon from: {icon_path}")
     app.setWindowIcon(QIcon(icon_path))  # Set the application icon
     window = ezShareCPAP()
-    
+    window_built = time.perf_counter()
+
     # Set the window file path to ensure the icon is shown on macOS
     window.setWindowFilePath(icon_path)
 
-    # Detect macOS dark mode and load the appropriate stylesheet
-    if is_dark_mode():
-        stylesheet = load_stylesheet(resource_path("style_dark.qss"))
-    else:
-        stylesheet = load_stylesheet(resource_path("style_light.qss"))
-        
-    app.setStyleSheet(stylesheet)
-    
+    # The window applies the light or dark stylesheet itself and follows appearance changes
     window.show()
+    if profile_startup:
+        # Fires on the first event loop pass, after the window has been exposed
+        QTimer.singleShot(0, lambda: report_startup(app, window_built))
     sys.exit(app.exec())
 
 if __name__ == "__main__":
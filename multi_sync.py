@@ -0,0 +1,118 @@
+# multi_sync.py
+# Sync several cards in one run. Each [Card:<name>] section of config.ini is a profile with its own
+# url, path, ssid and psk. Cards without an SSID are reachable on the current network (e.g. bridged onto
+# the LAN) and sync concurrently, one worker process each. Cards that need their Wi-Fi network joined
+# share the machine's single radio, so they sync one after another in their own worker process.
+import concurrent.futures
+import multiprocessing.managers
+import queue
+import signal
+import threading
+import time
+from ezshare import ezShare
+from progress import Coalescer
+
+CARD_SECTION_PREFIX = 'Card:'
+
+# Read every [Card:<name>] section; missing keys fall back to [Settings] and [WiFi]
+def load_card_profiles(config):
+    profiles = []
+    for section in config.sections():
+        if not section.startswith(CARD_SECTION_PREFIX):
+            continue
+        card = config[section]
+        profiles.append({
+            'name': section[len(CARD_SECTION_PREFIX):].strip(),
+            'url': card.get('url', config['Settings'].get('url')),
+            'path': card.get('path', config['Settings'].get('path')),
+            'ssid': card.get('ssid', config['WiFi'].get('ssid')) or None,
+            'psk': card.get('psk', config['WiFi'].get('psk')),
+        })
+    return profiles
+
+# How often a worker checks whether the parent asked every card to stop
+STOP_POLL_INTERVAL = 0.1
+
+# Worker and manager processes leave Ctrl-C to the parent, which cancels every card cooperatively
+def ignore_interrupts():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+# Cancel ezshare's sync once the parent sets stop; returns when stop is set or done is
+def watch_stop(ezshare, stop, done):
+    while not done.is_set():
+        if stop.wait(STOP_POLL_INTERVAL):
+            ezshare.cancel()
+            return
+
+# Run one card's sync in a worker process, forwarding its status and progress to the parent
+def sync_card(profile, params, events, stop):
+    name = profile['name']
+    ezshare = ezShare()
+    ezshare.set_params(path=profile['path'], url=profile['url'], ssid=profile['ssid'], psk=profile['psk'], **params)
+    done = threading.Event()
+    watcher = threading.Thread(target=watch_stop, args=(ezshare, stop, done), name='ezshare-stop', daemon=True)
+    watcher.start()
+    # Progress arrives per chunk; only the latest value per interval is sent to the parent
+    progress_updates = Coalescer(lambda value: events.put((name, 'progress', value)))
+    ezshare.set_status_callback(lambda message: events.put((name, 'status', message)))
+    ezshare.set_progress_callback(progress_updates.submit)
+    started = time.perf_counter()
+    try:
+        completed = bool(ezshare.run())
+    except Exception as e:
+        events.put((name, 'status', f'Error: {e}'))
+        completed = False
+    finally:
+        done.set()
+        watcher.join()
+    progress_updates.flush()
+    events.put((name, 'progress', 100))
+    return {'card': name, 'completed': completed, 'processed': ezshare.processed_files,
+            'total': ezshare.total_files, 'listing_errors': ezshare.listing_errors,
+            'seconds': round(time.perf_counter() - started, 3)}
+
+def sync_cards_in_turn(profiles, params, events, stop):
+    return [sync_card(profile, params, events, stop) for profile in profiles]
+
+# Sync all profiles and return one summary per card. on_event(card, kind, value, overall) is called in this
+# process for every status/progress event, with overall being the mean progress across all cards.
+# Cancelling cancel_token stops every card the same way as a single sync: completed files are kept.
+def sync_cards(profiles, params, on_event=None, cancel_token=None):
+    lan_cards = [profile for profile in profiles if not profile['ssid']]
+    wifi_cards = [profile for profile in profiles if profile['ssid']]
+    progress = {profile['name']: 0.0 for profile in profiles}
+    summaries = []
+
+    manager = multiprocessing.managers.SyncManager()
+    manager.start(ignore_interrupts)
+    with manager:
+        events = manager.Queue()
+        stop = manager.Event()
+        workers = len(lan_cards) + (1 if wifi_cards else 0)
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max(1, workers), initializer=ignore_interrupts) as pool:
+            futures = [pool.submit(sync_card, profile, params, events, stop) for profile in lan_cards]
+            if wifi_cards:
+                futures.append(pool.submit(sync_cards_in_turn, wifi_cards, params, events, stop))
+
+            def drain(timeout):
+                try:
+                    name, kind, value = events.get(timeout=timeout)
+                except queue.Empty:
+                    return False
+                if kind == 'progress':
+                    progress[name] = value
+                if on_event:
+                    on_event(name, kind, value, sum(progress.values()) / len(progress))
+                return True
+
+            while not all(future.done() for future in futures):
+                if cancel_token and cancel_token.cancelled and not stop.is_set():
+                    stop.set()
+                drain(0.1)
+            while drain(0):
+                pass
+
+            for future in futures:
+                result = future.result()
+                summaries.extend(result if isinstance(result, list) else [result])
+    return summaries
@@ -0,0 +1,80 @@
+# pipeline.py
+import asyncio
+import concurrent.futures
+import logging
+from file_ops import (list_dir, expand_listing, needs_download, fetch_entry, new_batch, publish_batch, transfer_status,
+                      refetch_invalid)
+from progress import file_weight
+
+logger = logging.getLogger(__name__)
+
+# Crawl and download at the same time: a crawler fills a queue that downloaders drain while it keeps listing.
+# Entries are appended to ezshare.manifest and ezshare.total_files grows as pending files are discovered.
+# Files that failed validation are downloaded again once the pipeline has drained.
+def pipelined_traversal(ezshare, url, dir_path, processed_files, since=None):
+    processed_files = asyncio.run(run_pipeline(ezshare, url, dir_path, processed_files, since))
+    return refetch_invalid(ezshare, ezshare.total_files, processed_files)
+
+async def run_pipeline(ezshare, url, dir_path, processed_files, since):
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    state = {'processed': processed_files}
+    # Per directory: staging batch, its pending entries and how many are still in flight
+    batches = {}
+    ezshare.manifest = []
+    ezshare.total_files = 0
+    ezshare.byte_progress.reset()
+
+    # Blocking listing and download calls run on a private pool so the event loop never waits on the card
+    with concurrent.futures.ThreadPoolExecutor(max_workers=ezshare.max_workers + 1,
+                                               thread_name_prefix='ezshare-pipeline') as executor:
+
+        async def crawl(dir_url, local_dir):
+            files, dirs = await loop.run_in_executor(executor, list_dir, ezshare, dir_url)
+            entries, subdirs = expand_listing(dir_url, local_dir, files, dirs, since)
+            ezshare.manifest.extend(entries)
+            pending = [entry for entry in entries if needs_download(ezshare, entry)]
+            if pending:
+                ezshare.total_files += len(pending)
+                ezshare.byte_progress.add_total(sum(file_weight(entry.size) for entry in pending))
+                batches[local_dir] = [new_batch(ezshare, local_dir), pending, len(pending)]
+                for entry in pending:
+                    await queue.put(entry)
+            for subdir_url, subdir_path in subdirs:
+                await crawl(subdir_url, subdir_path)
+
+        async def download():
+            while True:
+                entry = await queue.get()
+                if entry is None:
+                    return
+                group = batches[entry.path.parent]
+                if await loop.run_in_executor(executor, fetch_entry, ezshare, entry, group[0]):
+                    state['processed'] += 1
+                    ezshare.processed_files = state['processed']
+                    report(entry)
+                group[2] -= 1
+                if not group[2]:
+                    await loop.run_in_executor(executor, publish_batch, ezshare, group[0], group[1])
+
+        # The total is still growing while crawling; the byte progress never moves backwards
+        def report(entry):
+            ezshare.update_status(transfer_status(ezshare, 'Downloaded', entry, state['processed'], ezshare.total_files))
+
+        downloaders = [asyncio.create_task(download()) for _ in range(ezshare.max_workers)]
+        try:
+            await crawl(url, dir_path)
+            logger.info('Crawl finished: %d files listed, %d pending', len(ezshare.manifest), ezshare.total_files)
+        finally:
+            for _ in downloaders:
+                await queue.put(None)
+            # Publish what finished even when a downloader failed or the sync was cancelled
+            results = await asyncio.gather(*downloaders, return_exceptions=True)
+            for batch, pending, in_flight in batches.values():
+                if in_flight:
+                    publish_batch(ezshare, batch, pending)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    return state['processed']
@@ -0,0 +1,157 @@
+# progress.py
+# Byte-weighted sync progress and rate-limited delivery of progress/status updates.
+# Pure Python so the GUI worker, the CLI and the multi-card processes can all use it.
+import threading
+import time
+
+# The transfer rate is re-estimated at most this often and smoothed across samples
+RATE_SAMPLE_INTERVAL = 0.5
+RATE_SMOOTHING = 0.3
+
+# Minimum seconds between two updates forwarded to the UI
+UI_UPDATE_INTERVAL = 0.1
+
+# Progress of a sync measured in bytes, using the sizes shown in the card's listings.
+# Safe to update from several download threads; callback(percent) is called whenever the percentage grows.
+class ByteProgress:
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self, total=0):
+        with self.lock:
+            self.total = total
+            self.done = 0
+            self.reported = 0.0
+            self.rate = None
+            self.sample_time = time.perf_counter()
+            self.sample_bytes = 0
+            self.transferred = 0
+
+    # The pipelined engine discovers files while downloading, so the total can grow during a run
+    def add_total(self, nbytes):
+        with self.lock:
+            self.total += nbytes
+
+    # Track one file; its listing size is its weight in the overall progress
+    def file(self, size):
+        return FileProgress(self, file_weight(size))
+
+    # done counts towards the percentage, transferred towards the rate
+    def advance(self, done, transferred):
+        with self.lock:
+            self.done += done
+            self.transferred += transferred
+            now = time.perf_counter()
+            if now - self.sample_time >= RATE_SAMPLE_INTERVAL:
+                rate = (self.transferred - self.sample_bytes) / (now - self.sample_time)
+                self.rate = rate if self.rate is None else RATE_SMOOTHING * rate + (1 - RATE_SMOOTHING) * self.rate
+                self.sample_time, self.sample_bytes = now, self.transferred
+            # Never move backwards, even when the total grows
+            percent = min(100.0, self.done / self.total * 100) if self.total else 0.0
+            if percent <= self.reported:
+                return
+            self.reported = percent
+        if self.callback:
+            self.callback(percent)
+
+    @property
+    def percent(self):
+        with self.lock:
+            return self.reported
+
+    # Throughput and time left, e.g. '1.4 MB/s, 0:42 left'; empty until a rate has been measured
+    def describe(self):
+        with self.lock:
+            rate, remaining = self.rate, max(0, self.total - self.done)
+        if not rate:
+            return ''
+        seconds = int(remaining / rate)
+        return f'{format_rate(rate)}, {seconds // 60}:{seconds % 60:02d} left'
+
+# One file's share of a ByteProgress. Listing sizes are rounded to KB, so the bytes counted for a file
+# are capped at its weight and topped up to exactly the weight when it finishes.
+class FileProgress:
+    def __init__(self, overall, weight):
+        self.overall = overall
+        self.weight = weight
+        self.counted = 0
+
+    def advance(self, nbytes):
+        self.count(nbytes, nbytes)
+
+    # Bytes already on disk from an earlier attempt: progress, but not throughput
+    def resumed(self, nbytes):
+        self.count(nbytes, 0)
+
+    def count(self, nbytes, transferred):
+        step = min(nbytes, self.weight - self.counted)
+        self.counted += step
+        self.overall.advance(step, transferred)
+
+    # Done with the file, whether it succeeded or not; it will not be retried in this run
+    def finish(self):
+        self.count(self.weight - self.counted, 0)
+
+# Weight of a file in the progress total; empty files still count for one byte so they move the bar
+def file_weight(size):
+    return max(1, size or 0)
+
+def format_rate(rate):
+    if rate >= 1024 ** 2:
+        return f'{rate / 1024 ** 2:.1f} MB/s'
+    return f'{rate / 1024:.0f} KB/s'
+
+# Holds only the newest update; producers on any thread overwrite it and a consumer polling at its own pace takes it
+class Mailbox:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = None
+
+    def put(self, *args):
+        with self.lock:
+            self.value = args
+
+    # The newest update since the last take, or None
+    def take(self):
+        with self.lock:
+            value, self.value = self.value, None
+        return value
+
+# Forward only the latest update to emit, at most once per interval. Intermediate updates are dropped;
+# the last one is delivered by a timer so it is never left stale once updates stop.
+class Coalescer:
+    def __init__(self, emit, interval=UI_UPDATE_INTERVAL):
+        self.emit = emit
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.pending = None
+        self.last = 0.0
+        self.timer = None
+
+    def submit(self, *args):
+        with self.lock:
+            now = time.monotonic()
+            wait = self.last + self.interval - now
+            if wait > 0 or self.timer is not None:
+                self.pending = args
+                if self.timer is None:
+                    self.timer = threading.Timer(wait, self.flush)
+                    self.timer.daemon = True
+                    self.timer.start()
+                return
+            self.last = now
+        self.emit(*args)
+
+    # Deliver any pending update now
+    def flush(self):
+        with self.lock:
+            args, self.pending = self.pending, None
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if args is not None:
+                self.last = time.monotonic()
+        if args is not None:
+            self.emit(*args)
@@ -0,0 +1,161 @@
+# sync_index.py
+import re
+import sqlite3
+import threading
+import datetime
+import json
+import logging
+import pathlib
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME = '.ezshare_index.sqlite'
+
+# DATALOG/YYYYMMDD night folders
+NIGHT_PATTERN = re.compile(r'\d{8}')
+
+# Persistent record of what has already been synced into the target directory
+class SyncIndex:
+    def __init__(self, root):
+        self.root = pathlib.Path(root)
+        self.db_path = self.root / INDEX_FILENAME
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.repaired = 0
+        self.conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS files (
+                                 path TEXT PRIMARY KEY,
+                                 remote_size INTEGER,
+                                 remote_ts REAL,
+                                 local_size INTEGER,
+                                 local_mtime REAL,
+                                 state TEXT NOT NULL)''')
+        self.conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        # EDF headers of synced DATALOG files; start is NULL for files whose header could not be read
+        self.conn.execute('''CREATE TABLE IF NOT EXISTS sessions (
+                                 path TEXT PRIMARY KEY,
+                                 night TEXT,
+                                 start REAL,
+                                 duration REAL,
+                                 records INTEGER,
+                                 signals TEXT,
+                                 local_mtime REAL)''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS sessions_start ON sessions (start)')
+        self.conn.commit()
+
+    # Key a local path by its location relative to the target directory
+    def key(self, local_path):
+        return pathlib.Path(local_path).relative_to(self.root).as_posix()
+
+    # Return True if the index says this manifest entry is already synced
+    def is_current(self, entry):
+        with self.lock:
+            row = self.conn.execute('SELECT remote_size, remote_ts, state FROM files WHERE path = ?',
+                                    (self.key(entry.path),)).fetchone()
+            if row and row[2] == 'synced' and row[1] == entry.ts and (entry.size is None or row[0] == entry.size):
+                self.hits += 1
+                return True
+            self.misses += 1
+            return False
+
+    # Record a file as synced, using its current state on disk as the local fingerprint
+    def record(self, entry):
+        stat = entry.path.stat()
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)',
+                              (self.key(entry.path), entry.size, entry.ts, stat.st_size, stat.st_mtime, 'synced'))
+
+    # Compare every synced row with the real file and mark drifted ones stale
+    def repair(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT path, local_size, local_mtime FROM files WHERE state = 'synced'").fetchall()
+            stale = []
+            for path, local_size, local_mtime in rows:
+                try:
+                    stat = (self.root / path).stat()
+                except OSError:
+                    stale.append((path,))
+                    continue
+                if stat.st_size != local_size or stat.st_mtime != local_mtime:
+                    stale.append((path,))
+            if stale:
+                self.conn.executemany("UPDATE files SET state = 'stale' WHERE path = ?", stale)
+                self.conn.commit()
+                logger.info('Sync index: %d entries no longer match the files on disk', len(stale))
+            self.repaired += len(stale)
+        return len(stale)
+
+    # Oldest DATALOG night (YYYYMMDD) with a file that drifted from the index, so incremental syncs list it again
+    def oldest_stale_night(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT path FROM files WHERE state = 'stale' AND path LIKE 'DATALOG/%/%'").fetchall()
+        nights = [parts[1] for parts in (path.split('/') for path, in rows) if len(parts) == 3 and NIGHT_PATTERN.fullmatch(parts[1])]
+        return min(nights) if nights else None
+
+    # Small persistent values such as the last fully synced DATALOG night
+    def get_meta(self, key, default=None):
+        with self.lock:
+            row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (key, value))
+            self.conn.commit()
+
+    # Synced DATALOG EDF files whose header is not indexed yet, or was indexed from an older copy
+    def unindexed_sessions(self):
+        with self.lock:
+            rows = self.conn.execute('''SELECT files.path FROM files LEFT JOIN sessions ON sessions.path = files.path
+                                        WHERE files.state = 'synced' AND files.path LIKE 'DATALOG/%.edf'
+                                        AND (sessions.path IS NULL OR sessions.local_mtime != files.local_mtime)''').fetchall()
+        return [self.root / path for path, in rows]
+
+    # Store the parsed header of a synced EDF file, or None to remember that it has no readable header
+    def record_session(self, local_path, night, header):
+        stat = pathlib.Path(local_path).stat()
+        if header is None:
+            row = (self.key(local_path), night, None, None, None, None, stat.st_mtime)
+        else:
+            row = (self.key(local_path), night, header.start.timestamp(), header.duration, header.records,
+                   json.dumps(header.signals), stat.st_mtime)
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?, ?, ?, ?)', row)
+
+    # Indexed EDF files recorded between two datetimes (overlapping either end), oldest first.
+    # Each is a dict with path, night, start, end, records and signals as {label: samples per second}.
+    def sessions_between(self, start, end):
+        with self.lock:
+            rows = self.conn.execute('''SELECT path, night, start, duration, records, signals FROM sessions
+                                        WHERE start IS NOT NULL AND start < ? AND start + COALESCE(duration, 0) >= ?
+                                        ORDER BY start, path''', (end.timestamp(), start.timestamp())).fetchall()
+        sessions = []
+        for path, night, session_start, duration, records, signals in rows:
+            begins = datetime.datetime.fromtimestamp(session_start)
+            sessions.append({'path': self.root / path, 'night': night, 'start': begins,
+                             'end': begins + datetime.timedelta(seconds=duration) if duration is not None else None,
+                             'records': records, 'signals': dict(json.loads(signals))})
+        return sessions
+
+    # Nights (YYYYMMDD) that have at least one indexed session
+    def nights(self):
+        with self.lock:
+            rows = self.conn.execute('SELECT DISTINCT night FROM sessions WHERE start IS NOT NULL ORDER BY night').fetchall()
+        return [night for night, in rows]
+
+    # Lookup counters for this session
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'repaired': self.repaired}
+
+    def flush(self):
+        with self.lock:
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.commit()
+            self.conn.close()
+        logger.info('Sync index closed: %s', self.stats())
@@ -0,0 +1,126 @@
+# tracing.py
+import time
+import json
+import logging
+import pathlib
+import datetime
+import threading
+import contextlib
+
+logger = logging.getLogger(__name__)
+
+# Individual spans kept per run; phase totals are always complete
+MAX_SPANS = 5000
+
+# Shared do-nothing context returned by a disabled tracer
+NULL_SPAN = contextlib.nullcontext()
+
+# Collects timed spans per sync phase and per-file transfer figures, then hands a report to its sinks.
+# Without sinks it is disabled and span()/record_file() return immediately.
+class Tracer:
+    def __init__(self, sinks=None):
+        self.sinks = list(sinks or [])
+        self.enabled = bool(self.sinks)
+        self.lock = threading.Lock()
+        self.start()
+
+    # Clear everything recorded so far and start timing a new run
+    def start(self):
+        self.started = time.time()
+        self.started_perf = time.perf_counter()
+        self.phases = {}
+        self.spans = []
+        self.files = []
+        self.counters = {}
+
+    def span(self, name, **attrs):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, attrs)
+
+    def add_span(self, name, start, duration, attrs):
+        with self.lock:
+            phase = self.phases.setdefault(name, {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+            phase['count'] += 1
+            phase['seconds'] += duration
+            phase['max_seconds'] = max(phase['max_seconds'], duration)
+            if len(self.spans) < MAX_SPANS:
+                self.spans.append({'name': name, 'start': round(start - self.started_perf, 6),
+                                   'seconds': round(duration, 6), **attrs})
+
+    def record_file(self, path, size, duration):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.files.append({'path': str(path), 'bytes': size, 'seconds': round(duration, 6),
+                               'mb_per_s': round(size / duration / 1024 ** 2, 3) if duration > 0 else None})
+
+    # Attach run-level figures such as connection or sync index counters
+    def set_counters(self, name, values):
+        if self.enabled:
+            self.counters[name] = values
+
+    def report(self):
+        wall = time.perf_counter() - self.started_perf
+        total_bytes = sum(item['bytes'] for item in self.files)
+        transfer_seconds = sum(item['seconds'] for item in self.files)
+        return {
+            'started': datetime.datetime.fromtimestamp(self.started).isoformat(timespec='seconds'),
+            'wall_seconds': round(wall, 3),
+            'phases': {name: {key: round(value, 6) if isinstance(value, float) else value
+                              for key, value in phase.items()}
+                       for name, phase in self.phases.items()},
+            'transfers': {'files': len(self.files), 'bytes': total_bytes,
+                          'seconds': round(transfer_seconds, 3),
+                          'mb_per_s': round(total_bytes / transfer_seconds / 1024 ** 2, 3) if transfer_seconds else None},
+            'counters': self.counters,
+            'files': self.files,
+            'spans': self.spans,
+        }
+
+    # Build the report and pass it to every sink; a failing sink never breaks the sync
+    def finish(self):
+        if not self.enabled:
+            return None
+        report = self.report()
+        for sink in self.sinks:
+            try:
+                sink.emit(report)
+            except Exception as e:
+                logger.warning('Trace sink %s failed: %s', type(sink).__name__, e)
+        return report
+
+class Span:
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        self.tracer.add_span(self.name, self.start, duration, self.attrs)
+        return False
+
+# Writes the report as JSON, replacing the previous run's file
+class JsonReportSink:
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+
+    def emit(self, report):
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        tmp_path.write_text(json.dumps(report, indent=2))
+        tmp_path.replace(self.path)
+        logger.info('Performance report written to %s', self.path)
+
+# Logs a one-line summary per phase
+class LoggingSink:
+    def emit(self, report):
+        logger.info('Sync took %.2fs: %s', report['wall_seconds'],
+                    ', '.join(f"{name} {phase['seconds']:.2f}s/{phase['count']}" for name, phase in report['phases'].items()))
+        logger.info('Transfers: %s', report['transfers'])
@@ -171,6 +171,30 @@ class Ui_ezShareCPAP(object):
         self.pskEntry.setObjectName("pskEntry")
         self.pskLayout.addWidget(self.pskEntry)
         self.verticalLayout.addLayout(self.pskLayout)
+
+        self.workersLayout = QtWidgets.QHBoxLayout()
+        self.workersLayout.setObjectName("workersLayout")
+        self.workersLayout.setSpacing(10)  # Set uniform horizontal spacing
+        self.workersLabel = QtWidgets.QLabel(self.centralwidget)
+        font = QtGui.QFont()
+        font.setFamily("Geneva")
+        font.setPointSize(14)
+        font.setBold(True)
+        font.setWeight(QtGui.QFont.Weight.Bold)
+        self.workersLabel.setFont(font)
+        self.workersLabel.setObjectName("workersLabel")
+        self.workersLayout.addWidget(self.workersLabel)
+        self.workersSpinBox = QtWidgets.QSpinBox(self.centralwidget)
+        self.workersSpinBox.setRange(1, 8)
+        self.workersSpinBox.setMinimumHeight(35)
+        font = QtGui.QFont()
+        font.setFamily("Andale Mono")
+        font.setPointSize(14)
+        self.workersSpinBox.setFont(font)
+        self.workersSpinBox.setObjectName("workersSpinBox")
+        self.workersLayout.addWidget(self.workersSpinBox)
+        self.workersLayout.addStretch()
+        self.verticalLayout.addLayout(self.workersLayout)
         
         self.horizontalLayout = QtWidgets.QHBoxLayout()
         self.horizontalLayout.setObjectName("horizontalLayout")
@@ -339,6 +363,10 @@ class Ui_ezShareCPAP(object):
         self.actionEz_Share_Config.setObjectName("actionEz_Share_Config")
         self.menuTools.addAction(self.actionEz_Share_Config)
 
+        self.actionFull_Sync = QtGui.QAction(ezShareCPAP)
+        self.actionFull_Sync.setObjectName("actionFull_Sync")
+        self.menuTools.addAction(self.actionFull_Sync)
+
         self.actionCheck_Access_Oscar = QtGui.QAction(ezShareCPAP)
         self.actionCheck_Access_Oscar.setObjectName("actionCheck_Access_Oscar")
         self.menuTools.addAction(self.actionCheck_Access_Oscar)
@@ -358,6 +386,7 @@ class Ui_ezShareCPAP(object):
         self.urlLabel.setText(_translate("ezShareCPAP", "URL: "))
         self.ssidLabel.setText(_translate("ezShareCPAP", "WiFi SSID:"))
         self.pskLabel.setText(_translate("ezShareCPAP", "WiFi PSK: "))
+        self.workersLabel.setText(_translate("ezShareCPAP", "Parallel Downloads:"))
         self.ezShareConfigBtn.setText(_translate("ezShareCPAP", " ez Share Config"))
         self.importOscarCheckbox.setText(_translate("ezShareCPAP", " Import with OSCAR"))
         self.quitCheckbox.setText(_translate("ezShareCPAP", " Quit"))
@@ -372,6 +401,7 @@ class Ui_ezShareCPAP(object):
         self.actionChange_Path.setText(_translate("ezShareCPAP", "Change Path"))
         self.actionSave_Settings.setText(_translate("ezShareCPAP", "Save"))
         self.actionEz_Share_Config.setText(_translate("ezShareCPAP", "ez Share Config"))
+        self.actionFull_Sync.setText(_translate("ezShareCPAP", "Full Re-sync"))
         self.actionCheck_Access_Oscar.setText(_translate("ezShareCPAP", "Check Access To Oscar"))
         self.actionQuit.setText(_translate("ezShareCPAP", "Quit"))
 
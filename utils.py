@@ -1,7 +1,10 @@
+import functools
 import os
 import subprocess
 import sys
-from PySide6.QtWidgets import QFileDialog, QMessageBox
+from PySide6.QtCore import Qt
+from PySide6.QtGui import QPalette
+from PySide6.QtWidgets import QApplication, QFileDialog, QMessageBox
 
 
 def resource_path(relative_path):
@@ -13,27 +16,38 @@ def resource_path(relative_path):
     
     return os.path.join(base_path, relative_path)
     
+# Dark or light appearance as reported by Qt, without spawning `defaults`.
+# Qt 6.5+ exposes the platform colour scheme; otherwise the palette Qt derived from the platform theme is used.
 def is_dark_mode():
-    try:
-        result = subprocess.run(
-            ['defaults', 'read', '-g', 'AppleInterfaceStyle'],
-            capture_output=True, text=True, check=True)
-        return 'Dark' in result.stdout
-    except subprocess.CalledProcessError:
-        return False
+    app = QApplication.instance()
+    hints = app.styleHints()
+    if hasattr(hints, 'colorScheme'):
+        scheme = hints.colorScheme()
+        if scheme != Qt.ColorScheme.Unknown:
+            return scheme == Qt.ColorScheme.Dark
+    palette = app.palette()
+    return palette.color(QPalette.ColorRole.Window).lightness() < palette.color(QPalette.ColorRole.WindowText).lightness()
 
+# Read once per file; theme switches reuse the cached text
+@functools.lru_cache(maxsize=None)
 def load_stylesheet(file_name):
     file_path = resource_path(file_name)
     with open(file_path, "r") as file:
         return file.read()
 
-def ensure_disk_access(directory, parent):
+# Create the download directory if needed; no UI, so it can run off the GUI thread
+def probe_disk_access(directory):
     expanded_directory = os.path.expanduser(directory)
     if not os.path.exists(expanded_directory):
         try:
             os.makedirs(expanded_directory)
         except PermissionError:
-            request_disk_access(parent)
+            return False
+    return True
+
+def ensure_disk_access(directory, parent):
+    if not probe_disk_access(directory):
+        request_disk_access(parent)
 
 def check_disk_access(directory):
     expanded_directory = os.path.expanduser(directory)
@@ -59,7 +73,19 @@ def request_accessibility_access(parent):
                             'Please enable accessibility access for this application in System Preferences.')
     subprocess.run(["open", "x-apple.systempreferences:com.apple.preference.security?Privacy_Accessibility"])
 
-def check_oscar_installed():
-    """Check if OSCAR is installed on the system."""
+@functools.lru_cache(maxsize=None)
+def probe_oscar_installed():
     oscar_installed = subprocess.run(["osascript", "-e", 'id of application "OSCAR"'], capture_output=True, text=True)
     return oscar_installed.returncode == 0
+
+def check_oscar_installed(refresh=False):
+    """Check if OSCAR is installed on the system.
+
+    The answer is cached for the session. With refresh, a cached "not installed" is checked again,
+    since OSCAR may have been installed since.
+    """
+    installed = probe_oscar_installed()
+    if refresh and not installed:
+        probe_oscar_installed.cache_clear()
+        installed = probe_oscar_installed()
+    return installed
@@ -1,36 +1,177 @@
+import functools
 import subprocess
 import logging
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
-# Connect to the specified Wi-Fi network
-def connect_to_wifi(ezshare):
-    get_interface_cmd = 'networksetup -listallhardwareports'
+# Run a command given as an argument list, turning a failure into RuntimeError with the given context
+def run_command(args, error):
     try:
-        get_interface_result = subprocess.run(get_interface_cmd,
-                                              shell=True,
-                                              capture_output=True,
-                                              text=True, check=True)
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f'Error getting Wi-Fi interface name. Return code: {e.returncode}, error: {e.stderr}') from e
-
-    interface_lines = get_interface_result.stdout.split('\n')
-    for index, line in enumerate(interface_lines):
-        if 'Wi-Fi' in line:
-            ezshare.interface_name = interface_lines[index + 1].split(':')[1].strip()
-            break
-    if not ezshare.interface_name:
+        return subprocess.run(args, capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError) as e:
+        detail = f'Return code: {e.returncode}, error: {e.stderr}' if isinstance(e, subprocess.CalledProcessError) else str(e)
+        raise RuntimeError(f'{error}. {detail}') from e
+
+# Platform-specific way of joining and leaving the card's network
+class WifiBackend:
+    name = 'base'
+
+    def __init__(self):
+        self._interface = None
+
+    # Wi-Fi interface name, looked up once per backend and reused for every connect and disconnect
+    def interface(self):
+        if not self._interface:
+            self._interface = self.find_interface()
+        return self._interface
+
+    def find_interface(self):
+        raise NotImplementedError
+
+    # Network the interface is on now, or None
+    def current_network(self):
+        raise NotImplementedError
+
+    def connect(self, ssid, psk):
+        raise NotImplementedError
+
+    # Leave ssid and get back onto previous; returns how the home network was restored
+    def disconnect(self, ssid, previous=None):
+        raise NotImplementedError
+
+# macOS: networksetup
+class MacOSBackend(WifiBackend):
+    name = 'networksetup'
+
+    def find_interface(self):
+        result = run_command(['networksetup', '-listallhardwareports'], 'Error getting Wi-Fi interface name')
+        lines = result.stdout.split('\n')
+        for index, line in enumerate(lines):
+            if 'Wi-Fi' in line and index + 1 < len(lines):
+                return lines[index + 1].split(':')[1].strip()
         raise RuntimeError('No Wi-Fi interface found')
 
-    connect_cmd = f'networksetup -setairportnetwork {ezshare.interface_name} "{ezshare.ssid}" "{ezshare.psk}"'
-    try:
-        connect_result = subprocess.run(connect_cmd, shell=True,
-                                        capture_output=True,
-                                        text=True, check=True)
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f'Error connecting to {ezshare.ssid}. Return code: {e.returncode}, error: {e.stderr}') from e
-    if 'Failed' in connect_result.stdout:
-        raise RuntimeError(f'Error connecting to {ezshare.ssid}. Error: {connect_result.stdout}')
+    def current_network(self):
+        result = run_command(['networksetup', '-getairportnetwork', self.interface()], 'Error getting current Wi-Fi network')
+        prefix = 'Current Wi-Fi Network: '
+        output = result.stdout.strip()
+        return output[len(prefix):] if output.startswith(prefix) else None
+
+    def connect(self, ssid, psk):
+        result = run_command(['networksetup', '-setairportnetwork', self.interface(), ssid, psk],
+                             f'Error connecting to {ssid}')
+        if 'Failed' in result.stdout:
+            raise RuntimeError(f'Error connecting to {ssid}. Error: {result.stdout}')
+
+    def disconnect(self, ssid, previous=None):
+        interface = self.interface()
+        run_command(['networksetup', '-removepreferredwirelessnetwork', interface, ssid],
+                    f'Error removing network profile for {ssid}')
+        if previous:
+            # The password of a preferred network comes from the keychain
+            try:
+                result = run_command(['networksetup', '-setairportnetwork', interface, previous],
+                                     f'Error rejoining {previous}')
+                if 'Failed' not in result.stdout and 'Could not' not in result.stdout:
+                    logger.info('Rejoined %s on %s', previous, interface)
+                    return 'reassociated'
+                logger.warning('Could not rejoin %s: %s', previous, result.stdout.strip())
+            except RuntimeError as e:
+                logger.warning('%s', e)
+        self.power_cycle(interface)
+        return 'power_cycle'
+
+    # Last resort: the interface comes back up and joins whichever preferred network it finds
+    def power_cycle(self, interface):
+        run_command(['networksetup', '-setairportpower', interface, 'off'], 'Error toggling Wi-Fi interface power')
+        logger.info('Wi-Fi interface %s turned off', interface)
+        run_command(['networksetup', '-setairportpower', interface, 'on'], 'Error toggling Wi-Fi interface power')
+        logger.info('Wi-Fi interface %s turned on', interface)
+
+# Linux: NetworkManager through nmcli
+class NetworkManagerBackend(WifiBackend):
+    name = 'nmcli'
+
+    def find_interface(self):
+        result = run_command(['nmcli', '-t', '-f', 'DEVICE,TYPE', 'device'], 'Error getting Wi-Fi interface name')
+        for line in result.stdout.splitlines():
+            device, _, device_type = line.rpartition(':')
+            if device_type == 'wifi':
+                return device.replace('\\:', ':')
+        raise RuntimeError('No Wi-Fi interface found')
+
+    # Name of the active connection profile on the Wi-Fi interface
+    def current_network(self):
+        interface = self.interface()
+        result = run_command(['nmcli', '-t', '-f', 'NAME,DEVICE', 'connection', 'show', '--active'],
+                             'Error getting current Wi-Fi network')
+        for line in result.stdout.splitlines():
+            name, _, device = line.rpartition(':')
+            if device == interface:
+                return name.replace('\\:', ':')
+        return None
+
+    def connect(self, ssid, psk):
+        run_command(['nmcli', 'device', 'wifi', 'connect', ssid, 'password', psk, 'ifname', self.interface()],
+                    f'Error connecting to {ssid}')
+
+    def disconnect(self, ssid, previous=None):
+        run_command(['nmcli', 'connection', 'delete', 'id', ssid], f'Error removing network profile for {ssid}')
+        if previous:
+            try:
+                run_command(['nmcli', 'connection', 'up', 'id', previous], f'Error rejoining {previous}')
+                logger.info('Rejoined %s', previous)
+                return 'reassociated'
+            except RuntimeError as e:
+                logger.warning('%s', e)
+        # With the card's profile gone NetworkManager autoconnects to the usual network by itself
+        return 'autoconnect'
+
+# Does nothing: the card is already reachable, or a mock card is used in tests and benchmarks
+class NullBackend(WifiBackend):
+    name = 'null'
+
+    def find_interface(self):
+        return 'null'
+
+    def current_network(self):
+        return None
+
+    def connect(self, ssid, psk):
+        logger.info('Null Wi-Fi backend: pretending to join %s', ssid)
+
+    def disconnect(self, ssid, previous=None):
+        logger.info('Null Wi-Fi backend: pretending to leave %s', ssid)
+        return 'none'
+
+BACKENDS = {
+    'Darwin': MacOSBackend,
+    'Linux': NetworkManagerBackend,
+}
+
+# One backend per platform for the life of the process, so interface discovery is only done once
+@functools.lru_cache(maxsize=None)
+def get_backend(platform_system):
+    backend = BACKENDS.get(platform_system)
+    if backend is None:
+        logger.warning('No Wi-Fi backend for %s, joining networks is left to the user', platform_system)
+        return NullBackend()
+    return backend()
+
+# Guards the check-and-clear of connection_id so concurrent disconnects only leave the network once
+disconnect_lock = threading.Lock()
+
+def backend_for(ezshare):
+    return ezshare.wifi_backend or get_backend(ezshare.platform_system)
+
+# Connect to the specified Wi-Fi network
+def connect_to_wifi(ezshare):
+    backend = backend_for(ezshare)
+    ezshare.interface_name = backend.interface()
+    ezshare.previous_network = remember_network(backend, ezshare.ssid, ezshare.previous_network)
+    backend.connect(ezshare.ssid, ezshare.psk)
     ezshare.connection_id = ezshare.ssid
     ezshare.connected = True
 
@@ -38,27 +179,34 @@ def connect_to_wifi(ezshare):
 def wifi_connected(ezshare):
     return ezshare.connected
 
-# Disconnect from the Wi-Fi network
+# Network to return to after the sync. When already on the card's network, e.g. still there after the
+# configuration page, the network recorded when the card was first joined (known) is kept.
+def remember_network(backend, ssid, known=None):
+    try:
+        previous = backend.current_network()
+    except RuntimeError as e:
+        logger.warning('Could not record the current Wi-Fi network: %s', e)
+        return known
+    if previous == ssid:
+        if known:
+            logger.info('Already on %s, will still return to %s after the sync', ssid, known)
+        return known
+    logger.info('Will return to %s after the sync', previous)
+    return previous
+
+# Disconnect from the Wi-Fi network and return to the one that was active before; safe to call repeatedly
 def disconnect_from_wifi(ezshare):
-    if ezshare.connection_id:
-        ezshare.print(f'Disconnecting from {ezshare.connection_id}...')
-
-        ezshare.print(f'Removing profile for {ezshare.connection_id}...')
-        profile_cmd = f'networksetup -removepreferredwirelessnetwork {ezshare.interface_name} "{ezshare.connection_id}"'
-        try:
-            subprocess.run(profile_cmd, shell=True,
-                           capture_output=True, text=True, check=True)
-        except subprocess.CalledProcessError as e:
-            raise RuntimeError(f'Error removing network profile for {ezshare.ssid}. Return code: {e.returncode}, error: {e.stderr}') from e
-        try:
-            subprocess.run(f'networksetup -setairportpower {ezshare.interface_name} off',
-                           shell=True, check=True)
-            logger.info('Wi-Fi interface %s turned off', ezshare.interface_name)
-            subprocess.run(f'networksetup -setairportpower {ezshare.interface_name} on',
-                           shell=True, check=True)
-            logger.info('Wi-Fi interface %s turned on', ezshare.interface_name)
-        except subprocess.CalledProcessError as e:
-            raise RuntimeError(f'Error toggling Wi-Fi interface power. Return code: {e.returncode}, error: {e.stderr}') from e
-        finally:
-            ezshare.connected = False
-            ezshare.connection_id = None
+    with disconnect_lock:
+        connection_id, ezshare.connection_id = ezshare.connection_id, None
+    if not connection_id:
+        return
+    previous, ezshare.previous_network = ezshare.previous_network, None
+    ezshare.print(f'Disconnecting from {connection_id}...')
+    started = time.perf_counter()
+    try:
+        method = backend_for(ezshare).disconnect(connection_id, previous)
+    finally:
+        ezshare.connected = False
+    ezshare.home_network = {'network': previous, 'method': method,
+                            'seconds': round(time.perf_counter() - started, 3)}
+    logger.info('Back on %s after %.2fs (%s)', previous or 'the home network', ezshare.home_network['seconds'], method)
@@ -1,36 +1,117 @@
-from PySide6.QtCore import QThread, Signal
-from wifi import connect_to_wifi, disconnect_from_wifi
+import queue
+from PySide6.QtCore import QThread, QTimer, Signal
+from progress import Mailbox, UI_UPDATE_INTERVAL
+from cancellation import Cancelled
 
 class ezShareWorker(QThread):
     progress = Signal(int)
     status = Signal(str, str)  # Added second parameter for message type (info/error)
+    rate = Signal(str)  # Throughput and time left
     finished = Signal()
 
     def __init__(self, ezshare):
         super().__init__()
         self.ezshare = ezshare
         self._is_running = True
+        # Progress arrives per chunk from the download threads and status per file. Only the newest of each is kept,
+        # and a GUI-thread timer delivers it, so signals are emitted at a fixed rate and never from a download thread.
+        self.progress_updates = Mailbox()
+        self.status_updates = Mailbox()
+        self.errors = queue.SimpleQueue()  # Errors are never coalesced away
+        self.delivered = (None, None)  # Last progress and rate sent, so unchanged values are not re-sent
+        self.update_timer = QTimer(self)
+        self.update_timer.setInterval(int(UI_UPDATE_INTERVAL * 1000))
+        self.update_timer.timeout.connect(self.deliver_updates)
+        self.update_timer.start()
+        self.finished.connect(self.finish_updates)
 
     def run(self):
         self.ezshare.set_progress_callback(self.update_progress)
         self.ezshare.set_status_callback(self.update_status)
         try:
-            connect_to_wifi(self.ezshare)  # Connect to Wi-Fi before starting the process
-            self.ezshare.run()
+            self.ezshare.run()  # Joins the card's network and returns to the previous one itself
         except RuntimeError as e:
             self.update_status(f'Error: {e}', 'error')
         finally:
-            disconnect_from_wifi(self.ezshare)  # Disconnect from Wi-Fi after the process completes
             self.finished.emit()
 
     def update_progress(self, value):
-        self.progress.emit(min(max(0, value), 100))  # Ensure progress is between 0 and 100
+        self.progress_updates.put(min(max(0, value), 100))  # Ensure progress is between 0 and 100
 
     def update_status(self, message, message_type='info'):
-        self.status.emit(message, message_type)
+        if message_type == 'error':
+            self.errors.put(message)
+        else:
+            self.status_updates.put(message, message_type)
+
+    # Runs on the GUI thread
+    def deliver_updates(self):
+        progress = self.progress_updates.take()
+        if progress:
+            value, rate = int(progress[0]), self.ezshare.byte_progress.describe()
+            last_value, last_rate = self.delivered
+            if value != last_value:
+                self.progress.emit(value)
+            if rate != last_rate:
+                self.rate.emit(rate)
+            self.delivered = (value, rate)
+        status = self.status_updates.take()
+        if status:
+            self.status.emit(*status)
+        while not self.errors.empty():
+            self.status.emit(self.errors.get(), 'error')
 
+    def finish_updates(self):
+        self.update_timer.stop()
+        self.deliver_updates()
+
+    # Returns straight away; run() stops within one chunk, cleans up and leaves the card's network, then emits finished
     def stop(self):
         self._is_running = False
-        self.terminate()  # Forcefully terminate the thread
-        disconnect_from_wifi(self.ezshare)  # Ensure Wi-Fi is disconnected when stopping
-        self.ezshare.disconnect_from_wifi()
+        self.ezshare.cancel()
+
+# Joins the card's network and waits for its web server, for a visit to the card's settings page.
+# Once the card answers it stays on the card's network so the page can be used; finished carries whether it did.
+class ezShareConfigWorker(QThread):
+    progress = Signal(int)
+    status = Signal(str, str)
+    finished = Signal(bool)
+
+    def __init__(self, ezshare, config_url):
+        super().__init__()
+        self.ezshare = ezshare
+        self.config_url = config_url
+
+    def run(self):
+        self.ezshare.set_status_callback(self.update_status)
+        self.progress.emit(0)
+        ready = False
+        try:
+            ready = self.ezshare.join_card_network(ready_url=self.config_url)
+        except Cancelled:
+            self.update_status('Configuration cancelled.')
+        except RuntimeError as e:
+            self.update_status(f'Error: {e}', 'error')
+        finally:
+            if not ready:
+                self.ezshare.disconnect_from_wifi()  # Nothing to configure, so go back to the home network
+            self.progress.emit(100 if ready else 0)
+            self.finished.emit(ready)
+
+    def update_status(self, message, message_type='info'):
+        self.status.emit(message, message_type)
+
+    def stop(self):
+        self.ezshare.cancel()
+
+# Runs a blocking call, such as a startup probe, off the GUI thread and emits its return value
+class BackgroundTask(QThread):
+    result = Signal(object)
+
+    def __init__(self, function, *args):
+        super().__init__()
+        self.function = function
+        self.args = args
+
+    def run(self):
+        self.result.emit(self.function(*self.args))